@@ -0,0 +1,50 @@
+# Copyright (c) 2020 Raytheon BBN Technologies, Inc.  All Rights Reserved.
+# This document does not contain technology or Technical Data controlled under either
+# the  U.S. International Traffic in Arms Regulations or the U.S. Export Administration
+import contextlib
+import logging
+import tempfile
+import time
+import unittest
+from functools import partial
+from torch.base.util import run_checks, can_fork
+
+def noisy_check(idx):
+    # Later checks finish first, so workers come back out of order.
+    time.sleep(0.05 * (3 - idx % 4))
+    logging.getLogger('torch.test').warning("check {:d} warned".format(idx))
+    print("check {:d} printed".format(idx))
+    logging.getLogger('torch.test').error("check {:d} failed".format(idx))
+    return idx % 2 == 0
+
+class RunChecksTest(unittest.TestCase):
+    def run_with_handlers(self, jobs):
+        # A real file, so anything a worker writes itself lands in it too.
+        out = tempfile.TemporaryFile('w+')
+        torch_logger = logging.getLogger('torch')
+        root_logger = logging.getLogger()
+        torch_handler = logging.StreamHandler(out)
+        torch_handler.setFormatter(logging.Formatter('torch: %(message)s'))
+        root_handler = logging.StreamHandler(out)
+        root_handler.setFormatter(logging.Formatter('root: %(message)s'))
+        torch_logger.addHandler(torch_handler)
+        root_logger.addHandler(root_handler)
+        try:
+            with contextlib.redirect_stdout(out):
+                results = run_checks([ partial(noisy_check, i) for i in range(8) ], jobs=jobs)
+        finally:
+            torch_logger.removeHandler(torch_handler)
+            root_logger.removeHandler(root_handler)
+        with out:
+            out.seek(0)
+            return (results, out.read())
+
+    @unittest.skipUnless(can_fork(), "needs fork")
+    def test_jobs_match_serial(self):
+        (serial_results, serial_out) = self.run_with_handlers(1)
+        (forked_results, forked_out) = self.run_with_handlers(3)
+        self.assertEqual(serial_results, forked_results)
+        self.assertEqual(serial_out, forked_out)
+
+if __name__ == '__main__':
+    unittest.main()
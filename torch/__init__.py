@@ -1,6 +1,14 @@
 # Copyright (c) 2020 Raytheon BBN Technologies, Inc.  All Rights Reserved.
 # This document does not contain technology or Technical Data controlled under either
 # the  U.S. International Traffic in Arms Regulations or the U.S. Export Administration
+import time
+# Start of 'import torch'; 'torch --timing' reports how long it took.
+import_started = time.perf_counter()
+
+__version__ = '0.1.0'
+
 import logging
 logging.getLogger('torch').setLevel('INFO')
 from .cli import main
+
+import_time = time.perf_counter() - import_started
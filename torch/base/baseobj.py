@@ -4,6 +4,7 @@
 import logging
 import pathlib
 import sys
+from .configcache import config_cache
 
 class BaseObject:
     """
@@ -20,6 +21,12 @@ class BaseObject:
     in at least one underlay extended by a final class.
     
     """
+    __slots__ = ()
+
+    # Compact record class generated for this class, if any.
+    record_class = None
+    # Slot descriptors holding a record's state, if it uses slots.
+    record_slots = None
 
     @classmethod
     def static_init(cls, config_path=None):
@@ -28,6 +35,29 @@ class BaseObject:
             source = sys.modules[cls.__module__].__file__
             cls.config_path = pathlib.Path(source).parent / config_path
 
+    @classmethod
+    def defer_static_init(cls, **kwargs):
+        """
+        Put off calling static_init until this class is first used.
+
+        Classes that might never show up in a given run
+        (most section types, for instance)
+        can skip parsing their configs at import time.
+        Making an instance, or naming the class in another
+        class's config, runs the deferred static_init.
+        Anything else that needs the class's static state
+        should call ensure_static_init first.
+        """
+        cls.pending_init = kwargs
+
+    @classmethod
+    def ensure_static_init(cls):
+        kwargs = cls.__dict__.get('pending_init')
+        if kwargs is not None:
+            # Clear it first; static_init can make instances.
+            del cls.pending_init
+            cls.static_init(**kwargs)
+
     @classmethod
     def parse_config(cls):
         """
@@ -36,28 +66,102 @@ class BaseObject:
         Config files are CSV files containing several types of entries
         defined by the underlay classes combined with this module.
         """
-        with open(cls.config_path, 'r') as f:
-            val = f.readline().strip()
-            while val != '':
-                if not val.startswith('#'):
-                    split = val.split(',', 1)
-                    key = split[0]
-                    entry = split[1].split(',')
-                    cls.parse_config_line(key, entry)
-                val = f.readline().strip()
+        for (key, entry) in config_cache.read_config(cls.config_path):
+            cls.parse_config_line(key, list(entry))
 
 
+    @classmethod
+    def make_record_class(cls, field_names=()):
+        """
+        Generate a compact, slotted subclass for this class's instances.
+
+        That only works if every class this one is built from
+        declares __slots__; otherwise instances get a __dict__ anyway,
+        and we leave the class alone.
+        Underlays list the attributes they keep per-instance
+        in 'record_attrs'; the record class gets a slot
+        for each of those, plus one per field.
+
+        Once the record class exists, constructing this class
+        makes an instance of the record class instead.
+        """
+        for klass in cls.__mro__[:-1]:
+            if '__slots__' not in klass.__dict__:
+                return
+
+        attrs = list()
+        for klass in reversed(cls.__mro__):
+            for name in klass.__dict__.get('record_attrs', ()):
+                if name not in attrs:
+                    attrs.append(name)
+        for name in field_names:
+            if name not in attrs:
+                attrs.append(name)
+
+        record = type(cls.__name__, (cls,), {
+            '__slots__': tuple(attrs),
+            '__module__': cls.__module__,
+            '__qualname__': '{:s}.record_class'.format(cls.__qualname__)
+        })
+
+        slots = list()
+        for klass in record.__mro__[:-1]:
+            for name in klass.__dict__['__slots__']:
+                slots.append(klass.__dict__[name])
+        record.record_slots = tuple(slots)
+        cls.record_class = record
+
     @classmethod
     def parse_config_line(cls, key, entry):
         if not key.startswith('#'): 
             cls.l.error("Invalid config line: {:s}: {!s}".format(key, entry))
             raise ValueError("Invalid config line")
 
+    def __new__(cls, *args, **kwargs):
+        if 'pending_init' in cls.__dict__:
+            cls.ensure_static_init()
+        if cls.record_class is not None:
+            cls = cls.record_class
+        return object.__new__(cls)
+
     def __init__(self, **kwargs):
         """
         Constructor
         """
 
+    def clone(self):
+        """
+        Make a shallow copy of this object without calling its constructor.
+
+        Underlays that keep mutable per-object state
+        extend this to give the copy its own.
+        """
+        obj = object.__new__(type(self))
+        if self.record_slots is None:
+            obj.__dict__.update(self.__dict__)
+            return obj
+        for slot in self.record_slots:
+            try:
+                slot.__set__(obj, slot.__get__(self))
+            except AttributeError:
+                # Unset on the original; leave it unset on the copy.
+                pass
+        return obj
+
+    def __getstate__(self):
+        # Read slots straight from their descriptors.
+        # getattr would fall back to __getattr__ for unset slots,
+        # and a resolved reference would get pickled as a raw value.
+        if self.record_slots is None:
+            return self.__dict__
+        state = dict()
+        for slot in self.record_slots:
+            try:
+                state[slot.__name__] = slot.__get__(self)
+            except AttributeError:
+                pass
+        return (None, state)
+
     @property
     def size(self):
         self.l.error("The 'size' property is not implemented.")
@@ -79,4 +183,7 @@ class BaseObject:
         raise NotImplementedError("Missing the to_bytes method")
 
     def __getattr__(self, name):
+        if name.startswith('__'):
+            # Slotted records have no __dict__; dir() below goes looking for one.
+            raise AttributeError(name)
         raise AttributeError("No attribute '{:s}' on {!s}: {!s}".format(name, type(self), dir(self)))
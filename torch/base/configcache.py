@@ -0,0 +1,139 @@
+# Copyright (c) 2020 Raytheon BBN Technologies, Inc.  All Rights Reserved.
+# This document does not contain technology or Technical Data controlled under either
+# the  U.S. International Traffic in Arms Regulations or the U.S. Export Administration
+import atexit
+import logging
+import marshal
+import os
+import pathlib
+import sys
+
+# Bump this if the format of cached entries changes.
+CACHE_VERSION = 1
+
+l = logging.getLogger('torch.configcache')
+
+class ConfigCache:
+    """
+    Pre-parsed copies of the .tsf config files.
+
+    Every class parses its config at import time,
+    which used to mean reading and splitting a dozen files
+    line by line on every run.
+    This keeps the split entries for all of them
+    in a single marshalled file under torch/__pycache__,
+    the same way Python keeps compiled bytecode.
+
+    An entry is reused while its source's mtime and size match.
+    Otherwise the source gets hashed;
+    same contents means the entry is still good.
+
+    Setting TORCH_NO_CONFIG_CACHE in the environment
+    bypasses the cache entirely.
+    Like bytecode, nothing gets written if Python was told
+    not to write bytecode.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.entries = None
+        self.dirty = False
+        self.enabled = 'TORCH_NO_CONFIG_CACHE' not in os.environ
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        self.entries = dict()
+        try:
+            with open(self.path, 'rb') as f:
+                (version, entries) = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return
+        if version == CACHE_VERSION:
+            self.entries = entries
+
+    def save(self):
+        if not self.dirty or sys.dont_write_bytecode:
+            return
+        self.dirty = False
+        tmp_path = self.path.with_name('{:s}.{:d}'.format(self.path.name, os.getpid()))
+        try:
+            self.path.parent.mkdir(exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                marshal.dump((CACHE_VERSION, self.entries), f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            # Read-only installs just don't get a cache.
+            l.debug("Couldn't write config cache {!s}: {!s}".format(self.path, e))
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+    def read_config(self, config_path):
+        """
+        Get the (key, entry) pairs for a config file.
+
+        Comment lines are already dropped.
+        """
+        config_path = str(config_path)
+        if not self.enabled:
+            return split_config(read_config_file(config_path))
+        if self.entries is None:
+            self.load()
+
+        st = os.stat(config_path)
+        cached = self.entries.get(config_path)
+        if cached is not None:
+            (mtime, size, digest, entries) = cached
+            if mtime == st.st_mtime_ns and size == st.st_size:
+                self.hits += 1
+                return entries
+
+        raw = read_config_file(config_path)
+        digest = config_digest(raw)
+        if cached is not None and cached[2] == digest:
+            # Touched, not changed.  Just refresh the stamp.
+            self.hits += 1
+            entries = cached[3]
+        else:
+            self.misses += 1
+            entries = split_config(raw)
+        self.entries[config_path] = (st.st_mtime_ns, st.st_size, digest, entries)
+        self.mark_dirty()
+        return entries
+
+    def mark_dirty(self):
+        # Write everything out once, rather than once per miss.
+        if not self.dirty:
+            self.dirty = True
+            atexit.register(self.save)
+
+def read_config_file(config_path):
+    with open(config_path, 'rb') as f:
+        return f.read()
+
+def config_digest(raw):
+    # hashlib drags in OpenSSL, which costs more than
+    # the whole cache saves; only pay for it on a miss.
+    import hashlib
+    return hashlib.sha256(raw).hexdigest()
+
+def split_config(raw):
+    """
+    Split a config file into (key, entry) pairs.
+
+    Config files are CSV files; the first column is the key,
+    and the rest of the line is the entry.
+    """
+    entries = list()
+    for val in raw.decode('utf-8').splitlines():
+        val = val.strip()
+        if val == '':
+            # A blank line ends the config.
+            break
+        if not val.startswith('#'):
+            split = val.split(',', 1)
+            entries.append((split[0], split[1].split(',')))
+    return entries
+
+config_cache = ConfigCache(pathlib.Path(__file__).parent.parent / '__pycache__' / 'tsf-configs.cache')
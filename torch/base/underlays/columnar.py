@@ -0,0 +1,203 @@
+# Copyright (c) 2020 Raytheon BBN Technologies, Inc.  All Rights Reserved.
+# This document does not contain technology or Technical Data controlled under either
+# the  U.S. International Traffic in Arms Regulations or the U.S. Export Administration
+from array import array
+from collections.abc import Mapping, MutableSequence
+from itertools import islice
+from .struct import int_formats
+
+# array typecodes for unsigned columns, by field size.
+column_typecodes = dict()
+for typecode in 'BHILQ':
+    column_typecodes.setdefault(array(typecode).itemsize, typecode)
+
+class ColumnarRecords(MutableSequence):
+    """
+    Column-oriented storage for a table of fixed-size records.
+
+    Each field lives in its own array, one entry per record.
+    Record objects only get built when someone asks for one;
+    they're cloned from the table's prototype record,
+    filled in from the columns, and kept from then on.
+    Once the table's references are resolved, records
+    resolve their own references as they get built.
+    Untouched records are written straight from the columns.
+
+    This only holds while the records stay in their original order.
+    The first insert, delete, or replacement builds every record,
+    and from then on this is a thin wrapper around a plain list.
+    """
+    chunk_size = 4096
+
+    @classmethod
+    def supports(cls, layout):
+        if layout is None or layout.packers is None:
+            return False
+        for (code, size) in zip(layout.codes, layout.sizes):
+            if code not in int_formats.values() or size not in column_typecodes:
+                return False
+        return True
+
+    def __init__(self, table, prototype, layout):
+        self.table = table
+        self.prototype = prototype
+        self.layout = layout
+        self.columns = [ array(column_typecodes[size]) for size in layout.sizes ]
+        self.rows = list()
+        self.materialized = list()
+        self.objs = None
+        # Set once the table's references are resolved.
+        self.root = None
+
+    def from_bytes(self, data):
+        count = len(data) // self.layout.size
+        end = count * self.layout.size
+        records = self.layout.packers[self.table.byteorder].iter_unpack(data[:end])
+
+        # Transpose in chunks, so we never hold a tuple per record.
+        while True:
+            chunk = list(islice(records, self.chunk_size))
+            if len(chunk) == 0:
+                break
+            for (column, vals) in zip(self.columns, zip(*chunk)):
+                column.extend(vals)
+        self.rows = [ None ] * count
+
+    @property
+    def columnar(self):
+        return self.objs is None
+
+    def get_row(self, row):
+        """
+        Get the record object for a row in the original order.
+        """
+        obj = self.rows[row]
+        if obj is None:
+            obj = self.prototype.clone()
+            obj.set_fields(self.layout, [ column[row] for column in self.columns ])
+            obj._idx = row
+            obj._offset = row * self.layout.size
+            self.rows[row] = obj
+            self.materialized.append(row)
+            if self.root is not None:
+                # Raw references resolve against the tables as loaded,
+                # so it doesn't matter how late this happens.
+                obj.resolve_references(self.root)
+        return obj
+
+    def materialize(self):
+        """
+        Build every record.  Returns True if that built anything.
+        """
+        if len(self.materialized) == len(self.rows):
+            return False
+        for i in range(0, len(self.rows)):
+            self.get_row(i)
+        return True
+
+    def unfreeze(self):
+        if self.objs is None:
+            self.materialize()
+            self.objs = list(self.rows)
+
+    def __len__(self):
+        if self.objs is None:
+            return len(self.rows)
+        return len(self.objs)
+
+    def __getitem__(self, idx):
+        if self.objs is not None:
+            return self.objs[idx]
+        if isinstance(idx, slice):
+            return [ self.get_row(i) for i in range(*idx.indices(len(self.rows))) ]
+        if idx < 0:
+            idx += len(self.rows)
+        if idx < 0 or idx >= len(self.rows):
+            raise IndexError("Record index out of range")
+        return self.get_row(idx)
+
+    def __iter__(self):
+        if self.objs is not None:
+            return iter(self.objs)
+        return (self.get_row(i) for i in range(0, len(self.rows)))
+
+    def __setitem__(self, idx, val):
+        self.unfreeze()
+        self.objs[idx] = val
+
+    def __delitem__(self, idx):
+        self.unfreeze()
+        del self.objs[idx]
+
+    def insert(self, idx, val):
+        self.unfreeze()
+        self.objs.insert(idx, val)
+
+    def loaded_values(self, name):
+        """
+        Get a field's column, as loaded.
+
+        Rows that have been built may have changed since.
+        """
+        return self.columns[self.layout.names.index(name)]
+
+    def field_values(self, name):
+        """
+        Get the current value of a field for every record, as an array.
+        """
+        column_idx = self.layout.names.index(name)
+        typecode = self.columns[column_idx].typecode
+        if self.objs is not None:
+            return array(typecode, (getattr(obj, name) for obj in self.objs))
+
+        out = array(typecode, self.columns[column_idx])
+        for row in self.materialized:
+            out[row] = getattr(self.rows[row], name)
+        return out
+
+    def to_bytes(self, write):
+        if self.objs is not None:
+            out = 0
+            for obj in self.objs:
+                out += obj.to_bytes(write)
+            return out
+
+        size = self.layout.size
+        packer = self.layout.packers[self.table.byteorder]
+        buf = bytearray(size * len(self.rows))
+        for (row, vals) in enumerate(zip(*self.columns)):
+            obj = self.rows[row]
+            if obj is None:
+                packer.pack_into(buf, row * size, *vals)
+            else:
+                chunks = list()
+                obj.to_bytes(chunks.append)
+                buf[row * size:(row + 1) * size] = b''.join(chunks)
+        write(buf)
+        return len(buf)
+
+    @property
+    def size(self):
+        return len(self) * self.layout.size
+
+class ColumnarOffsets(Mapping):
+    """
+    Offset lookup for columnar records, in their original order.
+
+    A record's original offset is just its row times the record size.
+    """
+    def __init__(self, records):
+        self.records = records
+
+    def __getitem__(self, off):
+        size = self.records.layout.size
+        if not isinstance(off, int) or off % size != 0 or off < 0 or off // size >= len(self.records.rows):
+            raise KeyError(off)
+        return self.records.get_row(off // size)
+
+    def __iter__(self):
+        size = self.records.layout.size
+        return iter(range(0, len(self.records.rows) * size, size))
+
+    def __len__(self):
+        return len(self.records.rows)
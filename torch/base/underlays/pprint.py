@@ -4,6 +4,8 @@
 from ..util import *
 
 class PPrintUnderlay:
+    __slots__ = ()
+
     @classmethod
     def static_init(cls, **kwargs):
         super(PPrintUnderlay, cls).static_init(**kwargs)
@@ -1,11 +1,18 @@
 # Copyright (c) 2020 Raytheon BBN Technologies, Inc.  All Rights Reserved.
 # This document does not contain technology or Technical Data controlled under either
 # the  U.S. International Traffic in Arms Regulations or the U.S. Export Administration
+from types import MappingProxyType
 from .table import TableUnderlay
 from .struct import StructUnderlay
 
+# Shared stand-in for a record with no references of a kind.
+# Most records never get any, so they all share this one.
+no_references = MappingProxyType(dict())
+
 class ReferenceUnderlay:
-  
+    __slots__ = ()
+    record_attrs = ('idx_references', 'off_references', 'field_references')
+
     @classmethod
     def static_init(cls, **kwargs):
         super(ReferenceUnderlay, cls).static_init(**kwargs)
@@ -89,11 +96,26 @@ class ReferenceUnderlay:
         cls.field_ignore_vals.setdefault(name, set()).add(val)
 
     def __init__(self, **kwargs):
-        self.idx_references = dict()
-        self.off_references = dict()
-        self.field_references = dict()
+        self.idx_references = no_references
+        self.off_references = no_references
+        self.field_references = no_references
         super().__init__(**kwargs)
 
+    def clone(self):
+        obj = super().clone()
+        obj.idx_references = no_references
+        obj.off_references = no_references
+        obj.field_references = no_references
+        return obj
+
+    def add_reference(self, kind, name, val):
+        # Records get their own reference dicts the first time they need one.
+        refs = getattr(self, kind)
+        if refs is no_references:
+            refs = dict()
+            setattr(self, kind, refs)
+        refs[name] = val
+
     def resolve_references(self, root):
         for (name, handler) in self.idx_ref_handlers.items():
             if isinstance(self, StructUnderlay) and name not in self.enabled_field_set:
@@ -137,10 +159,11 @@ class ReferenceUnderlay:
             return
 
         # If the value is out of bounds for the table's indexes, warn.
-        if len(table) <= idx:
-            self.l.warn("Requested index for {:s} {:d} is out of bounds (0, {:d})".format(name, idx, len(table)))
+        if table.loaded_length <= idx:
+            self.l.warn("Requested index for {:s} {:d} is out of bounds (0, {:d})".format(name, idx, table.loaded_length))
             return
-        self.idx_references[name] = table[idx]
+        # Raw indexes point into the table as it was loaded.
+        self.add_reference('idx_references', name, table.get_loaded_item(idx))
         delattr(self, name)
 
     def resolve_off_reference(self, name, table):
@@ -150,7 +173,8 @@ class ReferenceUnderlay:
         if name in self.field_ignore_vals and off in self.field_ignore_vals[name]:
             return
 
-        self.off_references[name] = table.get_item_by_offset(off)
+        # Raw offsets point into the table as it was loaded.
+        self.add_reference('off_references', name, table.get_loaded_item_by_offset(off))
         delattr(self, name)
 
     def resolve_field_reference(self, name, field, table, search=True):
@@ -158,22 +182,29 @@ class ReferenceUnderlay:
         if search:
             val = getattr(self, name)
             # If the value is one we've beem told to ignore, ignore it.
-            if name in self.field_ignore_vals and off in self.field_ignore_vals[name]:
+            if name in self.field_ignore_vals and val in self.field_ignore_vals[name]:
                 return
 
-            for i in table:
-                if getattr(i, field) == val:
-                    item = i
-                    break
+            if isinstance(table, TableUnderlay):
+                # Every referrer searches the same table, so share an index.
+                item = table.find_item_by_field(field, val)
+            else:
+                for i in table:
+                    if getattr(i, field) == val:
+                        item = i
+                        break
             if item is None:
                 self.l.error("Could not find an item with value {!s} for field {:s}".format(val, field))
                 raise ValueError("Unknown field referecne")
         else:
             item = table
-        self.field_references[name] = (item, field)
+        self.add_reference('field_references', name, (item, field))
         delattr(self, name)
 
     def __getattr__(self, name):
+        if name.startswith('__'):
+            # Unpickling looks for hooks before the reference slots are set.
+            return super().__getattr__(name)
         if name in self.idx_references:
             return self.idx_references[name].idx
         elif name in self.off_references:
@@ -1,7 +1,56 @@
 # Copyright (c) 2020 Raytheon BBN Technologies, Inc.  All Rights Reserved.
 # This document does not contain technology or Technical Data controlled under either
 # the  U.S. International Traffic in Arms Regulations or the U.S. Export Administration
+import struct
 from ..util import *
+
+# struct format codes for as_int fields, by field size.
+int_formats = {
+    1: 'B',
+    2: 'H',
+    4: 'I',
+    8: 'Q'
+}
+
+byteorder_formats = {
+    'little': '<',
+    'big': '>'
+}
+
+class StructLayout:
+    """
+    Precompiled layout of a struct with a particular set of fields enabled.
+
+    Layouts are shared by every record with the same wordsize
+    and the same enabled fields.  If every enabled field
+    maps onto a struct format code, the layout also carries
+    a compiled struct.Struct per byteorder, so a whole record
+    can be read or written with a single call.
+    """
+    def __init__(self, cls, wordsize, mask):
+        self.owner = cls
+        self.wordsize = wordsize
+        self.mask = mask
+        self.names = tuple(name for (name, enabled) in zip(cls.names[wordsize], mask) if enabled)
+        self.field_set = frozenset(self.names)
+        self.sizes = tuple(size for (size, enabled) in zip(cls.sizes[wordsize], mask) if enabled)
+        self.size = sum(self.sizes)
+
+        codes = [ code for (code, enabled) in zip(cls.codes[wordsize], mask) if enabled ]
+        self.codes = tuple(codes)
+        # struct pads or truncates bytes fields to fit; we'd rather it didn't.
+        self.bytes_fields = tuple((name, size) for (name, size, code) in zip(self.names, self.sizes, codes) if code is not None and code.endswith('s'))
+        if None in codes:
+            # At least one field needs its handler; no shortcuts.
+            self.packers = None
+        else:
+            fmt = ''.join(codes)
+            self.packers = { k: struct.Struct(v + fmt) for (k, v) in byteorder_formats.items() }
+
+    def __reduce__(self):
+        # Compiled structs don't pickle; look the layout back up instead.
+        return (self.owner.get_layout, (self.wordsize, self.mask))
+
 class StructUnderlay:
     """
     Record underlay for defining struct parsing.
@@ -10,6 +59,8 @@ class StructUnderlay:
     in a config file, and have the program load such a struct
     into a python class from a byte stream.
     """
+    __slots__ = ()
+    record_attrs = ('byteorder', 'wordsize', 'layout')
 
     @classmethod
     def static_init(cls, **kwargs):
@@ -36,10 +87,19 @@ class StructUnderlay:
             4: cls.sizes_32,
             8: cls.sizes_64
         }
+
+        cls.codes_32 = list()
+        cls.codes_64 = list()
+        cls.codes = {
+            4: cls.codes_32,
+            8: cls.codes_64
+        }
         
         cls.optional_fields = dict()
+        cls.layouts = dict()
+        cls.prefix_layouts = dict()
 
-        cls.add_field_handler("as_is", lambda self, x, idx: x, lambda self, x, idx: x)
+        cls.add_field_handler("as_is", lambda self, x, idx: bytes(x), lambda self, x, idx: x)
         cls.add_field_handler("as_int", cls.to_int, cls.from_int)
 
     @classmethod
@@ -50,6 +110,68 @@ class StructUnderlay:
     def from_int(cls, self, val, idx):
         return val.to_bytes(cls.sizes[self.wordsize][idx], byteorder=self.byteorder)
 
+    @classmethod
+    def parse_config(cls):
+        super(StructUnderlay, cls).parse_config()
+        cls.compile_layouts()
+
+        field_names = list()
+        for names in cls.names.values():
+            field_names.extend(name for name in names if name not in field_names)
+        cls.make_record_class(field_names)
+
+    @classmethod
+    def compile_layouts(cls):
+        """
+        Precompile the layouts for records with every field enabled.
+
+        Layouts for other combinations of optional fields
+        get compiled the first time a record needs them.
+        """
+        cls.layouts.clear()
+        cls.prefix_layouts.clear()
+        for (wordsize, names) in cls.names.items():
+            cls.get_layout(wordsize, (True,) * len(names))
+
+            # Records with optional fields start by reading
+            # everything ahead of the first optional field.
+            prefix_mask = list()
+            for name in names:
+                prefix_mask.append(name not in cls.optional_fields and False not in prefix_mask)
+            cls.prefix_layouts[wordsize] = cls.get_layout(wordsize, tuple(prefix_mask))
+
+    @classmethod
+    def get_layout(cls, wordsize, mask):
+        key = (wordsize, mask)
+        if key not in cls.layouts:
+            cls.layouts[key] = StructLayout(cls, wordsize, mask)
+        return cls.layouts[key]
+
+    @classmethod
+    def get_fixed_layout(cls, wordsize):
+        """
+        Get the layout shared by every record of this class.
+
+        Returns None if records can differ in layout,
+        or can't be read with a single struct call.
+        """
+        if len(cls.optional_fields) != 0:
+            return None
+        layout = cls.get_layout(wordsize, (True,) * len(cls.names[wordsize]))
+        if layout.packers is None:
+            return None
+        return layout
+
+    @classmethod
+    def field_code(cls, handler, size):
+        # Only the stock handlers have a struct equivalent.
+        if handler is cls.field_handlers['as_int'] and size in int_formats:
+            return int_formats[size]
+        elif handler is cls.field_handlers['as_is']:
+            return '{:d}s'.format(size)
+        else:
+            return None
+
     @classmethod
     def add_field(cls, name, handler, size_32=None, size_64=None):
         """
@@ -70,14 +192,24 @@ class StructUnderlay:
             cls.names_32.append(name)
             cls.parse_handlers_32.append(handler)
             cls.sizes_32.append(size_32)
+            cls.codes_32.append(cls.field_code(handler, size_32))
 
         if size_64 is not None:
             cls.names_64.append(name)
             cls.parse_handlers_64.append(handler)
             cls.sizes_64.append(size_64)
+            cls.codes_64.append(cls.field_code(handler, size_64))
 
     @classmethod
     def add_optional(cls, name, handler):
+        """
+        Mark a field as optional.
+
+        The handler decides per-record if the field is present.
+        Handlers may only look at fields that appear before
+        the first optional field; those get read before
+        the rest of the record's layout is decided.
+        """
         if name in cls.optional_fields:
             cls.l.error("Optional field {:s} already exists")
             raise AttributeError("Duplicate optional field registered.")
@@ -145,56 +277,128 @@ class StructUnderlay:
         
         self.byteorder = byteorder
         self.wordsize = wordsize
-        self.enabled_fields = []
-        self.enabled_field_set = set()
+        self.layout = None
         
         super().__init__(**kwargs)
+
+    @property
+    def enabled_fields(self):
+        if self.layout is None:
+            return ()
+        return self.layout.mask
+
+    @property
+    def enabled_field_set(self):
+        if self.layout is None:
+            return frozenset()
+        return self.layout.field_set
+
+    def find_layout(self, data):
+        """
+        Figure out which fields this record has enabled.
+
+        Reads the fields ahead of the first optional field,
+        then asks the option handlers about the rest.
+        Returns None if that can't be done in one go.
+        """
+        names = self.names[self.wordsize]
+        prefix = self.prefix_layouts[self.wordsize]
+        if prefix.packers is None or len(data) < prefix.size:
+            return None
+
+        for (name, val) in zip(prefix.names, prefix.packers[self.byteorder].unpack_from(data)):
+            setattr(self, name, val)
+
+        mask = tuple(name not in self.optional_fields or bool(self.optional_fields[name](self, name)) for name in names)
+        return self.get_layout(self.wordsize, mask)
      
     def from_bytes(self, data):
+        if len(self.optional_fields) == 0:
+            layout = self.get_layout(self.wordsize, (True,) * len(self.names[self.wordsize]))
+        else:
+            layout = self.find_layout(data)
+
+        if layout is None or layout.packers is None or len(data) < layout.size:
+            self.parse_fields(data)
+            return
+
+        for (name, val) in zip(layout.names, layout.packers[self.byteorder].unpack_from(data)):
+            setattr(self, name, val)
+        self.layout = layout
+
+    def set_fields(self, layout, vals):
+        """
+        Fill in this record from already-decoded values.
+        """
+        for (name, val) in zip(layout.names, vals):
+            setattr(self, name, val)
+        self.layout = layout
+
+    def parse_fields(self, data):
+        """
+        Read the record one field at a time.
+
+        This is the fallback for records with custom field handlers,
+        or that run off the end of the data.
+        """
+        mask = list()
         off = 0
         for i in range(0, len(self.names[self.wordsize])):
             name = self.names[self.wordsize][i]
 
             # Check if this field is optional, and if we should read it.
             if name in self.optional_fields and not self.optional_fields[name](self, name):
-                self.enabled_fields.append(False)
+                mask.append(False)
                 continue
             else:
-                self.enabled_fields.append(True)
-                self.enabled_field_set.add(name)
+                mask.append(True)
 
             end = off + self.sizes[self.wordsize][i]
             bits = data[off:end]
             val = self.parse_handlers[self.wordsize][i][0](self, bits, i)
             setattr(self, name, val)
             off = end
-        if len(self.enabled_fields) != len(self.names[self.wordsize]):
-            self.l.error("Enabled fields can't account for all fields: expected {:d} records, got {:d}".format(len(self.enabled_fields), len(self.names[self.wordsize])))
+        if len(mask) != len(self.names[self.wordsize]):
+            self.l.error("Enabled fields can't account for all fields: expected {:d} records, got {:d}".format(len(mask), len(self.names[self.wordsize])))
             raise IndexError("Mismatched enabled fields and field names")
+        self.layout = self.get_layout(self.wordsize, tuple(mask))
 
     def from_dict(self, data):
+        mask = list()
         for i in range(0, len(self.names[self.wordsize])):
             name = self.names[self.wordsize][i]
             if name in self.optional_fields and not self.optional_fields[name](self, name):
-                self.enabled_fields.append(False)
+                mask.append(False)
                 continue
             else:
-                self.enabled_fields.append(True)
-                self.enabled_field_set.add(name)
+                mask.append(True)
 
             if name not in data:
                 raise AttributeError('Field {:s} is enabled, but not present in input: {!s}'.format(name, data.keys()))
 
             setattr(self, name, data[name])
         
-        if len(self.enabled_fields) != len(self.names[self.wordsize]):
-            self.l.error("Enabled fields can't account for all fields: expected {:d} records, got {:d}".format(len(self.enabled_fields), len(self.names[self.wordsize])))
+        if len(mask) != len(self.names[self.wordsize]):
+            self.l.error("Enabled fields can't account for all fields: expected {:d} records, got {:d}".format(len(mask), len(self.names[self.wordsize])))
             raise IndexError("Mismatched enabled fields and field names")
+        self.layout = self.get_layout(self.wordsize, tuple(mask))
 
     def to_bytes(self, write):
+        layout = self.layout
+        if layout is None:
+            return 0
+        for (name, size) in layout.bytes_fields:
+            if len(getattr(self, name)) != size:
+                self.l.error("Field {:s} is {:d} bytes, but should be {:d}".format(name, len(getattr(self, name)), size))
+                raise ValueError("Wrong size for field {:s}".format(name))
+        if layout.packers is not None:
+            data = layout.packers[self.byteorder].pack(*[ getattr(self, name) for name in layout.names ])
+            write(data)
+            return layout.size
+
         out = 0
         for i in range(0, len(self.names[self.wordsize])):
-            if self.enabled_fields[i]:
+            if layout.mask[i]:
                 val = getattr(self, self.names[self.wordsize][i])
                 data = self.parse_handlers[self.wordsize][i][1](self, val, i)
                 write(data)
@@ -203,11 +407,9 @@ class StructUnderlay:
 
     @property
     def size(self):
-        out = 0
-        for i in range(0, len(self.sizes[self.wordsize])):
-            if self.enabled_fields[i]:
-                out += self.sizes[self.wordsize][i]
-        return out
+        if self.layout is None:
+            return 0
+        return self.layout.size
 
     def pprint(self):
         print(type(self).__name__)
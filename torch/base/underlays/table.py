@@ -1,10 +1,19 @@
 # Copyright (c) 2020 Raytheon BBN Technologies, Inc.  All Rights Reserved.
 # This document does not contain technology or Technical Data controlled under either
 # the  U.S. International Traffic in Arms Regulations or the U.S. Export Administration
+import gc
 import sys
 from collections.abc import MutableSequence
+from contextlib import contextmanager
+from functools import partial
+from ..util import FenwickTree, LookupIndex
+from .columnar import ColumnarRecords, ColumnarOffsets
+from .struct import StructUnderlay
 
 class ItemUnderlay:
+    __slots__ = ()
+    record_attrs = ('_idx', '_offset', 'parent')
+
     def __init__(self, idx=None, offset=None, parent=None, **kwargs):
 
         if idx is None or offset is None or parent is None:
@@ -21,15 +30,20 @@ class ItemUnderlay:
         super().__init__(**kwargs)
 
     def clean(self):
-        self.parent.clean()
+        self.parent.item_changed(self)
 
     @property
     def offset(self):
-        return self._offset
+        parent = self.parent
+        if parent.dirty_from is None and parent.size_deltas is None:
+            return self._offset
+        return parent.item_offset(self)
 
     @property
     def idx(self):
-        return self._idx
+        if self.parent.dirty_from is None:
+            return self._idx
+        return self.parent.item_idx(self)
 
 class TableUnderlay(MutableSequence):
     @classmethod
@@ -37,6 +51,7 @@ class TableUnderlay(MutableSequence):
         super(TableUnderlay, cls).static_init(**kwargs)
         cls.allowed_types = set()
         cls.primary_class = None
+        cls.columnar = False
 
     @classmethod
     def parse_config_line(cls, key, entry):
@@ -44,6 +59,8 @@ class TableUnderlay(MutableSequence):
             cls.add_allowed_class(entry[0])
         elif key == 'ALLOWED_CLASS' and len(entry) == 2:
             cls.add_allowed_class(entry[0], tag=entry[1])
+        elif key == 'STORAGE' and len(entry) == 1:
+            cls.set_storage(entry[0])
         else:
             super(TableUnderlay, cls).parse_config_line(key, entry)
 
@@ -67,7 +84,12 @@ class TableUnderlay(MutableSequence):
             raise ValueError("Unknown module member")
 
         allowed_type = getattr(module, base_name)
+        if hasattr(allowed_type, 'ensure_static_init'):
+            # Items have to be set up before the tables holding them.
+            allowed_type.ensure_static_init()
         cls.allowed_types.add(allowed_type)
+        if getattr(allowed_type, 'record_class', None) is not None:
+            cls.allowed_types.add(allowed_type.record_class)
 
 
         if not issubclass(allowed_type, ItemUnderlay):
@@ -79,6 +101,18 @@ class TableUnderlay(MutableSequence):
         elif tag is not None:
             cls.l.error("Unknown tag for allowed class {:s}: {:s}".format(classname, tag))
 
+    @classmethod
+    def set_storage(cls, storage):
+        # 'columnar' keeps fixed-size records in per-field arrays,
+        # and only builds record objects as they get used.
+        if storage == 'objects':
+            cls.columnar = False
+        elif storage == 'columnar':
+            cls.columnar = True
+        else:
+            cls.l.error("Unknown storage type for {:s}: {:s}".format(cls.__name__, storage))
+            raise ValueError("Unknown storage type")
+
     @classmethod
     def get_record(cls, data, idx, offset, parent, **kwargs):
         if cls.primary_class is None:
@@ -92,6 +126,19 @@ class TableUnderlay(MutableSequence):
         super().__init__(**kwargs)
         self.items = list()
         self.offset_to_item = dict()
+        self.loaded_items = None
+        self.loaded_offsets = None
+        # Lowest index whose idx and offset may be out of date.
+        self.dirty_from = None
+        # Growth of items changed in place since the last layout, by index.
+        self.size_deltas = None
+        self.delta_from = None
+        self.batch_depth = 0
+        # Field name -> index of items by that field's value.
+        self.field_indexes = dict()
+        # Set whenever anything in the table changes.
+        # Whoever owns the table decides when it's clean again.
+        self.dirty = False
 
     def __getitem__(self, idx):
         return self.items[idx]
@@ -100,12 +147,14 @@ class TableUnderlay(MutableSequence):
         if type(val) not in self.allowed_types:
             self.l.error("Cannot accept item of type {!s}, only one of {!s}".format(type(val), self.allowed_types))
             raise TypeError("Item was not of allowed type.")
+        start = self.first_changed(idx)
         self.items[idx] = val
-        self.clean()
+        self.clean(start)
 
     def __delitem__(self, idx):
+        start = self.first_changed(idx)
         del self.items[idx]
-        self.clean()
+        self.clean(start)
  
     def __len__(self):
         return len(self.items)
@@ -114,16 +163,45 @@ class TableUnderlay(MutableSequence):
     def length(self):
         return len(self.items)
 
+    @property
+    def frozen(self):
+        # Columnar records still in the order they were loaded.
+        return isinstance(self.items, ColumnarRecords) and self.items.columnar
+
     def insert(self, idx, val):
         if type(val) not in self.allowed_types:
             self.l.error("Cannot accept item of type {!s}, only one of {!s}".format(type(val), self.allowed_types))
+        start = self.first_changed(idx)
         self.items.insert(idx, val)
-        self.clean()
+        self.clean(start)
+
+    def first_changed(self, idx):
+        # First index a change at <idx> can move.
+        length = len(self.items)
+        if isinstance(idx, slice):
+            if idx.step is not None and idx.step != 1:
+                return 0
+            return idx.indices(length)[0]
+        if idx < 0:
+            return max(idx + length, 0)
+        return min(idx, length)
+
+    @property
+    def offset_to_item(self):
+        self.settle()
+        return self._offset_to_item
+
+    @offset_to_item.setter
+    def offset_to_item(self, val):
+        self._offset_to_item = val
 
     def verify(self, root):
+        if self.frozen:
+            return self.verify_columnar(root)
         out = True
         last_item = None
         offset = 0
+        offset_to_item = self.offset_to_item
         for i in range(0, len(self.items)):
             item = self.items[i]
             if item.idx != i:
@@ -132,7 +210,7 @@ class TableUnderlay(MutableSequence):
             if item.offset != offset:
                 self.l.error("Offset mismatch: expected {:d} but found {:d}".format(offset, item.offset))
                 out = False
-            elif offset not in self.offset_to_item or self.offset_to_item[offset] != item:
+            elif offset not in offset_to_item or offset_to_item[offset] != item:
                 self.l.error("Bad offset table: item {:d} was not available under offset {:d}".format(i, offset))
                 out = False
             offset += item.size
@@ -140,27 +218,276 @@ class TableUnderlay(MutableSequence):
             out &= item.verify(root)
         return out
 
-    def clean(self):
-        offset = 0
-        self.offset_to_item.clear()
-        for idx in range(0, len(self.items)):
-            item = self.items[idx]
+    def verify_columnar(self, root):
+        # Records nobody has built are exactly as they were loaded,
+        # so only the ones that have been built need checking.
+        out = True
+        records = self.items
+        for row in records.materialized:
+            item = records.rows[row]
+            if item.idx != row:
+                self.l.error("Index mismatch: expected {:d} but found {:d}".format(row, item.idx))
+                out = False
+            if item.offset != row * records.layout.size:
+                self.l.error("Offset mismatch: expected {:d} but found {:d}".format(row * records.layout.size, item.offset))
+                out = False
+            out &= item.verify(root)
+        return out
+
+    def clean(self, start=0):
+        # Nothing before <start> moved; the rest gets laid out
+        # the next time somebody asks for an index or offset.
+        self.dirty = True
+        self.field_indexes = dict()
+        if self.frozen:
+            # Nothing has moved; every record is still at row * size.
+            return
+        self.mark_dirty(start)
+
+    def mark_dirty(self, start):
+        if self.size_deltas is not None:
+            # Indexes are about to shift under the deltas;
+            # fold them into the next layout instead.
+            start = min(start, self.delta_from)
+            self.size_deltas = None
+            self.delta_from = None
+        if self.dirty_from is None or start < self.dirty_from:
+            self.dirty_from = start
+
+    def item_changed(self, item):
+        # Only the items after it move, by however much it grew;
+        # that goes in a Fenwick tree rather than laying anything out.
+        self.dirty = True
+        if len(self.field_indexes) != 0:
+            self.field_indexes = dict()
+        if self.frozen:
+            return
+        items = self.items
+        idx = item._idx
+        if self.dirty_from is not None or self.batch_depth != 0:
+            # Everything gets laid out at once later anyway.
+            self.mark_dirty(idx)
+            return
+        if idx >= len(items) or items[idx] is not item:
+            # Not where we thought it was; start over.
+            self.mark_dirty(0)
+            return
+        if idx == len(items) - 1:
+            # Nothing comes after it.
+            self.mark_dirty(idx)
+            return
+
+        old_size = items[idx + 1]._offset - item._offset
+        if self.size_deltas is not None:
+            old_size += self.size_deltas.get(idx)
+        delta = item.size - old_size
+        if delta != 0:
+            # Changes that keep the size don't need a tree at all.
+            if self.size_deltas is None:
+                self.size_deltas = FenwickTree(len(items))
+                self.delta_from = idx
+            self.size_deltas.add(idx, delta)
+            self.delta_from = min(self.delta_from, idx)
+
+    def item_offset(self, item):
+        idx = item._idx
+        if self.dirty_from is None:
+            if idx < len(self.items) and self.items[idx] is item:
+                return item._offset + self.size_deltas.prefix(idx)
+            # Not in the table anymore; it keeps its last offset.
+            return item._offset
+        self.settle()
+        return item._offset
+
+    def item_idx(self, item):
+        idx = item._idx
+        if idx < self.dirty_from and idx < len(self.items) and self.items[idx] is item:
+            return idx
+        self.settle()
+        return item._idx
+
+    def settle(self):
+        start = self.dirty_from
+        if self.size_deltas is not None:
+            start = self.delta_from if start is None else min(start, self.delta_from)
+        if start is None:
+            return
+        self.dirty_from = None
+        self.size_deltas = None
+        self.delta_from = None
+
+        items = self.items
+        offset_map = self._offset_to_item
+        # Redo the item before the first change too,
+        # in case empty items shared its offset.
+        start = max(start - 1, 0)
+        if start == 0 or offset_map is self.loaded_offsets or not isinstance(offset_map, dict):
+            # Don't touch the map from load time.
+            start = 0
+            offset = 0
+            offset_map = dict()
+        else:
+            offset = items[start]._offset
+            # Offsets go into the map in order,
+            # so everything stale is at the end.
+            while len(offset_map) != 0 and next(reversed(offset_map)) >= offset:
+                offset_map.popitem()
+        for idx in range(start, len(items)):
+            item = items[idx]
             item._idx = idx
             item._offset = offset
-            self.offset_to_item[offset] = item
+            offset_map[offset] = item
             offset += item.size
+        self._offset_to_item = offset_map
+        self.laid_out(start)
+
+    def laid_out(self, start):
+        # Hook for tables that keep their own view of the layout.
+        pass
+
+    @contextmanager
+    def batch(self):
+        # Changes inside a batch get laid out once, at the end.
+        self.batch_depth += 1
+        try:
+            yield self
+        finally:
+            self.batch_depth -= 1
+            if self.batch_depth == 0:
+                self.settle()
+
+    def field_entries(self, field):
+        return ((getattr(item, field), item) for item in self.items)
+
+    def find_item_by_field(self, field, val):
+        index = self.field_indexes.get(field)
+        if index is None:
+            index = LookupIndex(partial(self.field_entries, field))
+            self.field_indexes[field] = index
+        return index.get(val)
+
+    def can_bulk_load(self):
+        # Needs a struct primary class parsed the stock way.
+        if type(self).get_record.__func__ is not TableUnderlay.get_record.__func__:
+            return False
+        if self.primary_class is None or not issubclass(self.primary_class, StructUnderlay):
+            return False
+        return self.primary_class.from_bytes is StructUnderlay.from_bytes
+
+    def bulk_from_bytes(self, data):
+        # Every record is a clone of one prototype, decoded in one pass
+        # if it's fixed-size.  None of these ever die, so skip the GC.
+        data = memoryview(data)
+        proto = self.primary_class(0, 0, self)
+        layout = self.primary_class.get_fixed_layout(self.wordsize)
+        if layout is not None:
+            # Fill in the prototype, so clones copy every field in one go.
+            proto.set_fields(layout, (0,) * len(layout.names))
+
+        if self.columnar and ColumnarRecords.supports(layout) and len(data) % layout.size == 0:
+            self.items = ColumnarRecords(self, proto, layout)
+            self.items.from_bytes(data)
+            self.offset_to_item = ColumnarOffsets(self.items)
+            return
 
-    def from_bytes(self, data):
         offset = 0
         idx = 0
-        while offset < len(data):
-            item = self.get_record(data, idx, offset, self)
-            self.items.append(item)
-            self.offset_to_item[offset] = item
-            offset += item.size
-            idx += 1
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            if layout is not None:
+                size = layout.size
+                end = len(data) - (len(data) % size)
+                for vals in layout.packers[self.byteorder].iter_unpack(data[:end]):
+                    item = proto.clone()
+                    item.set_fields(layout, vals)
+                    item._idx = idx
+                    item._offset = offset
+                    self.items.append(item)
+                    self._offset_to_item[offset] = item
+                    offset += size
+                    idx += 1
+
+            while offset < len(data):
+                item = proto.clone()
+                item._idx = idx
+                item._offset = offset
+                item.from_bytes(data[offset:])
+                self.items.append(item)
+                self._offset_to_item[offset] = item
+                offset += item.size
+                idx += 1
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def from_bytes(self, data):
+        if self.can_bulk_load():
+            self.bulk_from_bytes(data)
+        else:
+            offset = 0
+            idx = 0
+            while offset < len(data):
+                item = self.get_record(data, idx, offset, self)
+                self.items.append(item)
+                self._offset_to_item[offset] = item
+                offset += item.size
+                idx += 1
+        self.take_snapshot()
+
+    def take_snapshot(self):
+        # Raw indexes and offsets from the file point into the table
+        # as it was loaded, so references resolve against this.
+        if isinstance(self.items, ColumnarRecords):
+            self.loaded_items = self.items
+        else:
+            self.loaded_items = list(self.items)
+        self.loaded_offsets = self.offset_to_item
+
+    @property
+    def loaded_length(self):
+        if self.loaded_items is None:
+            return len(self.items)
+        if isinstance(self.loaded_items, ColumnarRecords):
+            return len(self.loaded_items.rows)
+        return len(self.loaded_items)
+
+    def get_loaded_item(self, idx):
+        if self.loaded_items is None:
+            return self.items[idx]
+        if isinstance(self.loaded_items, ColumnarRecords):
+            return self.loaded_items.get_row(idx)
+        return self.loaded_items[idx]
+
+    def get_loaded_item_by_offset(self, off):
+        if self.loaded_offsets is None:
+            return self.offset_to_item[off]
+        return self.loaded_offsets[off]
+
+    def moved_since_load(self):
+        # Raw indexes and offsets into this table are only good until one has.
+        if self.loaded_items is None:
+            return False
+        if isinstance(self.loaded_items, ColumnarRecords):
+            # Columnar records are fixed-size; checking indexes is enough.
+            if self.items is self.loaded_items and self.loaded_items.columnar:
+                return False
+            for idx in range(0, len(self.loaded_items.rows)):
+                if self.loaded_items.get_row(idx).idx != idx:
+                    return True
+            return False
+
+        for (idx, item) in enumerate(self.loaded_items):
+            if item.idx != idx:
+                return True
+        for (off, item) in self.loaded_offsets.items():
+            if item.offset != off:
+                return True
+        return False
 
     def to_bytes(self, write):
+        if isinstance(self.items, ColumnarRecords):
+            return self.items.to_bytes(write)
         out = 0
         for item in self.items:
             try:
@@ -171,12 +498,59 @@ class TableUnderlay(MutableSequence):
 
     @property
     def size(self):
+        if isinstance(self.items, ColumnarRecords):
+            return self.items.size
         out = 0
         for item in self.items:
             out += item.size
         return out
 
+    def field_values(self, name):
+        if isinstance(self.items, ColumnarRecords):
+            return self.items.field_values(name)
+        return [ getattr(item, name) for item in self.items ]
+
+    def resolve_references(self, root):
+        records = self.items
+        if isinstance(records, ColumnarRecords) and hasattr(self.primary_class, 'resolve_references'):
+            # Records resolve as they get built;
+            # only the ones that already exist need it now.
+            records.root = root
+            for row in list(records.materialized):
+                records.rows[row].resolve_references(root)
+            return
+        self.__getattr__('resolve_references')(root)
+
+    def get_reference_targets(self):
+        # Only columnar tables have records with unresolved references.
+        records = self.items
+        if not isinstance(records, ColumnarRecords) or records.root is None:
+            return list()
+        proto = records.prototype
+        out = list()
+        for handlers in (proto.idx_ref_handlers, proto.off_ref_handlers, proto.field_ref_handlers):
+            for (name, handler) in handlers.items():
+                if name not in records.layout.field_set:
+                    continue
+                table = handler(proto, records.root)
+                if isinstance(table, TableUnderlay) and table not in out:
+                    out.append(table)
+        return out
+
+    def settle_references(self):
+        # Unbuilt records get written from their raw values,
+        # which only works while nothing they point at has moved.
+        if not isinstance(self.items, ColumnarRecords):
+            return False
+        for table in self.get_reference_targets():
+            if table.moved_since_load():
+                return self.items.materialize()
+        return False
+
     def __getattr__(self, name):
+        if name.startswith('__'):
+            # Protocol lookups (pickle, copy) aren't item methods.
+            raise AttributeError(name)
         good = True
         for t in self.allowed_types:
             if not hasattr(t, name) or not callable(getattr(t, name)):
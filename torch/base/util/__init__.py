@@ -2,3 +2,7 @@
 # This document does not contain technology or Technical Data controlled under either
 # the  U.S. International Traffic in Arms Regulations or the U.S. Export Administration
 from .byteutil import *
+from .intervals import *
+from .fenwick import *
+from .parallel import *
+from .lookup import *
@@ -0,0 +1,37 @@
+# Copyright (c) 2020 Raytheon BBN Technologies, Inc.  All Rights Reserved.
+# This document does not contain technology or Technical Data controlled under either
+# the  U.S. International Traffic in Arms Regulations or the U.S. Export Administration
+class FenwickTree:
+    """
+    Running totals over a fixed number of slots.
+
+    Adding to a slot and summing a prefix of slots
+    are both O(log n), so a table can track how much
+    its items have grown without walking all of them.
+    """
+    def __init__(self, size):
+        self.tree = [ 0 ] * (size + 1)
+
+    def __len__(self):
+        return len(self.tree) - 1
+
+    def add(self, idx, delta):
+        i = idx + 1
+        n = len(self.tree)
+        while i < n:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix(self, idx):
+        """
+        Sum slots [0, idx).
+        """
+        i = min(idx, len(self.tree) - 1)
+        out = 0
+        while i > 0:
+            out += self.tree[i]
+            i -= i & -i
+        return out
+
+    def get(self, idx):
+        return self.prefix(idx + 1) - self.prefix(idx)
@@ -0,0 +1,82 @@
+# Copyright (c) 2020 Raytheon BBN Technologies, Inc.  All Rights Reserved.
+# This document does not contain technology or Technical Data controlled under either
+# the  U.S. International Traffic in Arms Regulations or the U.S. Export Administration
+import bisect
+
+class IntervalIndex:
+    """
+    Sorted index of half-open [start, end) intervals.
+
+    Built once from a list of (start, end, item) entries;
+    it doesn't notice if the items change afterwards,
+    so whoever owns it has to throw it out when they do.
+
+    Intervals are allowed to overlap.
+    Alongside the sorted starts, it keeps the furthest end
+    seen so far, so a point lookup only walks back
+    over intervals that could still reach the point.
+    """
+    def __init__(self, entries):
+        # Stable sort; items that start together keep their order.
+        entries = sorted(entries, key=lambda x: x[0])
+        self.starts = [ start for (start, end, item) in entries ]
+        self.ends = [ end for (start, end, item) in entries ]
+        self.items = [ item for (start, end, item) in entries ]
+        self.max_ends = list()
+        max_end = None
+        for end in self.ends:
+            if max_end is None or end > max_end:
+                max_end = end
+            self.max_ends.append(max_end)
+
+    def __len__(self):
+        return len(self.items)
+
+    def covering(self, point):
+        """
+        Get every item whose interval contains <point>, in start order.
+        """
+        out = list()
+        j = bisect.bisect_right(self.starts, point) - 1
+        while j >= 0 and self.max_ends[j] > point:
+            if self.ends[j] > point:
+                out.append(self.items[j])
+            j -= 1
+        out.reverse()
+        return out
+
+    def starting_in(self, lo, hi):
+        """
+        Get every item whose interval starts in [lo, hi), in start order.
+        """
+        return self.items[bisect.bisect_left(self.starts, lo):bisect.bisect_left(self.starts, hi)]
+
+    def entering(self, lo, hi):
+        """
+        Get every item whose interval starts before <lo>
+        and ends in [lo, hi), in start order.
+        """
+        out = list()
+        j = bisect.bisect_left(self.starts, lo) - 1
+        while j >= 0 and self.max_ends[j] >= lo:
+            if self.ends[j] >= lo and self.ends[j] < hi:
+                out.append(self.items[j])
+            j -= 1
+        out.reverse()
+        return out
+
+    def overlapping(self, lo, hi):
+        """
+        Get every item whose interval overlaps [lo, hi), in start order.
+
+        Same test as start < hi and end > lo,
+        so empty intervals strictly inside count.
+        """
+        out = list()
+        j = bisect.bisect_left(self.starts, hi) - 1
+        while j >= 0 and self.max_ends[j] > lo:
+            if self.ends[j] > lo:
+                out.append(self.items[j])
+            j -= 1
+        out.reverse()
+        return out
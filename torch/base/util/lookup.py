@@ -0,0 +1,45 @@
+# Copyright (c) 2020 Raytheon BBN Technologies, Inc.  All Rights Reserved.
+# This document does not contain technology or Technical Data controlled under either
+# the  U.S. International Traffic in Arms Regulations or the U.S. Export Administration
+class LookupIndex:
+    """
+    Dict from keys to the items that have them, built on first use.
+
+    <entries> is called to get (key, item) pairs in table order.
+    Whoever owns the index calls reset() whenever items get
+    added, removed or rekeyed; until then, a miss is a miss.
+    If <multi> is set, every item with a key is kept, in order;
+    otherwise, like a scan, a key finds the first item.
+    """
+    def __init__(self, entries, multi=False):
+        self.entries = entries
+        self.multi = multi
+        self.index = None
+
+    def reset(self):
+        self.index = None
+
+    @property
+    def built(self):
+        return self.index is not None
+
+    def build(self):
+        self.index = dict()
+        for (key, item) in self.entries():
+            self.add(key, item)
+        return self.index
+
+    def get(self, key, default=None):
+        index = self.index
+        if index is None:
+            index = self.build()
+        return index.get(key, default)
+
+    def add(self, key, item):
+        # Nothing to do if it hasn't been built yet.
+        if self.index is None:
+            return
+        if self.multi:
+            self.index.setdefault(key, list()).append(item)
+        else:
+            self.index.setdefault(key, item)
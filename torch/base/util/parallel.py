@@ -0,0 +1,91 @@
+# Copyright (c) 2020 Raytheon BBN Technologies, Inc.  All Rights Reserved.
+# This document does not contain technology or Technical Data controlled under either
+# the  U.S. International Traffic in Arms Regulations or the U.S. Export Administration
+import contextlib
+import logging
+import sys
+
+# The checks being run.  Workers get them by forking,
+# so nothing but indexes and results gets pickled.
+forked_checks = None
+
+class CheckCapture(logging.Handler):
+    """
+    Everything a check logged or printed, in the order it happened.
+    """
+    def __init__(self):
+        super().__init__()
+        self.events = list()
+
+    def emit(self, record):
+        # Arguments and tracebacks might not pickle; flatten them.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info is not None:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        self.events.append(record)
+
+    def write(self, text):
+        self.events.append(text)
+
+    def flush(self):
+        pass
+
+def run_forked_check(idx):
+    capture = CheckCapture()
+    logger = logging.getLogger('torch')
+    handlers = logger.handlers
+    propagate = logger.propagate
+    # Root handlers would see these too; the parent replays them instead.
+    logger.handlers = [ capture ]
+    logger.propagate = False
+    try:
+        with contextlib.redirect_stdout(capture):
+            result = forked_checks[idx]()
+    finally:
+        logger.handlers = handlers
+        logger.propagate = propagate
+    return (result, capture.events)
+
+def can_fork():
+    # Imported here; it's slow to load, and most runs never fork.
+    import multiprocessing
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+def run_checks(checks, jobs=1):
+    """
+    Call everything in <checks>, and return the results in order.
+
+    With more than one job, the checks get farmed out to
+    worker processes forked off this one, so they see
+    everything exactly as it stands when this is called.
+    Anything they change stays in the worker.
+    Whatever they log or print gets replayed here afterwards,
+    one check at a time, so diagnostics come out in the same
+    order no matter which worker finishes first.
+    """
+    global forked_checks
+    if jobs <= 1 or len(checks) <= 1 or not can_fork():
+        return [ check() for check in checks ]
+
+    import multiprocessing
+    # Anything still buffered would get written again by every worker.
+    sys.stdout.flush()
+    sys.stderr.flush()
+    forked_checks = checks
+    try:
+        with multiprocessing.get_context('fork').Pool(min(jobs, len(checks))) as pool:
+            results = pool.map(run_forked_check, range(len(checks)), chunksize=1)
+    finally:
+        forked_checks = None
+
+    out = list()
+    for (result, events) in results:
+        for event in events:
+            if isinstance(event, str):
+                sys.stdout.write(event)
+            else:
+                logging.getLogger(event.name).handle(event)
+        out.append(result)
+    return out
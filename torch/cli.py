@@ -3,16 +3,16 @@
 # the  U.S. International Traffic in Arms Regulations or the U.S. Export Administration
 import argparse
 import logging
-import pathlib
-import subprocess
+import os
 import sys
+import time
 from .scripting.executor import Executor
-from .elf import ELFLoader
+from .elf import ELFLoader, verify_levels
 
 class CLI:
     def __init__(self):
         self.args = self.parse_args()
-        self.executor = Executor()
+        self.executor = Executor(jobs=self.args.jobs, verify_level=self.args.verify)
 
     def parse_args(self):
         parser = argparse.ArgumentParser('torch - carving objects out of binaries')
@@ -20,8 +20,21 @@ class CLI:
                             help='Log all the things.')
         parser.add_argument('-l', '--log-file', action='store',
                             help='Write log data to a file.')
+        parser.add_argument('-t', '--timing', action='store_true',
+                            help='Report how long importing torch and running the script took.')
+        parser.add_argument('-j', '--jobs', action='store', type=int, default=1,
+                            help='Verify sections in up to this many worker processes when saving.')
+        parser.add_argument('--verify', action='store', type=str.upper,
+                            default=os.environ.get('TORCH_VERIFY_LEVEL', 'FULL'),
+                            help='How much to verify when saving, unless SAVE says otherwise: none, structural, or full.')
         parser.add_argument('script', help='Script path from which to read commands.')
-        return parser.parse_args()
+        args = parser.parse_args()
+        if args.jobs < 1:
+            parser.error('--jobs must be at least 1')
+        # The default comes from the environment, so check it here, not with choices.
+        if args.verify not in verify_levels:
+            parser.error('--verify must be one of: {:s}'.format(', '.join(level.lower() for level in verify_levels)))
+        return args
 
     def run(self):
         root_logger = logging.getLogger('torch')
@@ -35,7 +48,16 @@ class CLI:
         file_handler.setLevel('DEBUG')
         root_logger.addHandler(file_handler)
 
-        return self.executor.execute(self.args.script)
+        if not self.args.timing:
+            return self.executor.execute(self.args.script)
+
+        # Imported here; the package imports this module.
+        from . import import_time
+        started = time.perf_counter()
+        ret = self.executor.execute(self.args.script)
+        root_logger.info("Imported torch in {:.1f} ms".format(import_time * 1000))
+        root_logger.info("Ran {:s} in {:.1f} ms".format(self.args.script, (time.perf_counter() - started) * 1000))
+        return ret
 
 
 def main():
@@ -1,5 +1,5 @@
 # Copyright (c) 2020 Raytheon BBN Technologies, Inc.  All Rights Reserved.
 # This document does not contain technology or Technical Data controlled under either
 # the  U.S. International Traffic in Arms Regulations or the U.S. Export Administration
-from .elffile import ELFFile
+from .elffile import ELFFile, verify_levels
 from .elfloader import ELFLoader
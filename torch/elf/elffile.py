@@ -1,9 +1,15 @@
 # Copyright (c) 2020 Raytheon BBN Technologies, Inc.  All Rights Reserved.
 # This document does not contain technology or Technical Data controlled under either
 # the  U.S. International Traffic in Arms Regulations or the U.S. Export Administration
+import functools
 from .elfheader import *
 from .pheader import *
 from .sheader import *
+from .layout import ELFLayout
+from ..base.util import run_checks
+
+# How much checking ELFFile.verify() does, from least to most.
+verify_levels = ('NONE', 'STRUCTURAL', 'FULL')
 
 class ELFFile:
     def __init__(self):
@@ -12,8 +18,14 @@ class ELFFile:
         self.wordsize = 4
         self.prog_headers = None
         self.sect_headers = None
+        # Interval indexes over the headers; built on demand.
+        self.layout = None
+
+    def from_bytes(self, data, lazy=False):
+        # Work on a view of the input, so slicing out
+        # headers and sections doesn't copy the file.
+        data = memoryview(data)
 
-    def from_bytes(self, data):
         # Load the file header
         self.e_header.from_bytes(data)
         self.byteorder = self.e_header.byteorder
@@ -33,12 +45,46 @@ class ELFFile:
         sh_data = data[sh_start:sh_end]
         self.sect_headers.from_bytes(sh_data)
         
-        self.sect_headers.load_sections(data)
+        # Lazy loads leave most sections as raw bits until they're used.
+        self.sect_headers.load_sections(data, lazy=lazy)
 
         # Resolve everyone's references.
         self.e_header.resolve_references(self)
         self.sect_headers.resolve_references(self)
 
+        # Nothing has changed yet.
+        self.mark_clean()
+
+    def get_layout(self):
+        """
+        Get an ELFLayout for the file as it stands.
+
+        It's rebuilt if either header table's generation has moved on.
+        Sections bump the section table's whenever their contents change.
+        """
+        generation = (self.sect_headers.generation, self.prog_headers.generation)
+        if self.layout is None or self.layout.generation != generation:
+            self.layout = ELFLayout(self, generation)
+        return self.layout
+
+    def find_section_by_addr(self, addr):
+        return self.get_layout().find_section_by_addr(addr)
+
+    def find_section_by_offset(self, off):
+        return self.get_layout().find_section_by_offset(off)
+
+    def find_segments_by_addr(self, addr):
+        return self.get_layout().find_segments_by_addr(addr)
+
+    def find_segments_by_offset(self, off):
+        return self.get_layout().find_segments_by_offset(off)
+
+    def vaddr_to_offset(self, addr):
+        return self.get_layout().vaddr_to_offset(addr)
+
+    def offset_to_vaddr(self, off):
+        return self.get_layout().offset_to_vaddr(off)
+
     def object_to_bytes(self, f, obj, offset, filesize):
         if offset > filesize:
             diff = offset - filesize
@@ -58,20 +104,119 @@ class ELFFile:
         file_size = self.object_to_bytes(f, self.sect_headers, self.e_header.e_shoff, file_size)
         
         for sect_header in self.sect_headers:
-            file_size = self.object_to_bytes(f, sect_header.section, sect_header.sh_offset, file_size)
+            file_size = self.object_to_bytes(f, sect_header.get_output_section(), sect_header.sh_offset, file_size)
+
+    def verify(self, jobs=1, level='FULL'):
+        """
+        Check the file is sane before it gets written.
 
-    def verify(self):
-        out = self.e_header.verify(self)
-        out &= self.prog_headers.verify(self)
-        out &= self.sect_headers.verify(self)
-        for sect in map(lambda x: x.section, self.sect_headers):
-            out &= sect.verify(self)
-        return out
+        STRUCTURAL only checks the headers: where everything sits,
+        overlaps, and alignment.  FULL also checks the contents of
+        changed sections: hash tables, version references, strings.
+        NONE trusts whoever made the changes.
+        """
+        if level not in verify_levels:
+            raise ValueError('Unknown verification level: {!s}'.format(level))
+        if level == 'NONE':
+            return True
+
+        checks = [ self.e_header.verify, self.prog_headers.verify, self.sect_headers.verify ]
+        if level == 'FULL':
+            # Sections nobody touched are as good as they were when loaded.
+            # Pending sections go out exactly as they came in.
+            stale = self.stale_sections()
+            for sheader in self.sect_headers:
+                if sheader in stale:
+                    checks.append(sheader.section.verify)
+        # None of the checks depend on each other,
+        # so they can run side by side.
+        results = run_checks([ functools.partial(check, self) for check in checks ], jobs=jobs)
+        return all(results)
+
+    def stale_sections(self):
+        """
+        Find the headers of every section that needs organizing and verifying.
+
+        That's any decoded section that changed since the
+        file was loaded or last saved, and anything built
+        from one of those, all the way down.
+        If the section headers got shuffled, sections
+        holding raw header indexes count, too.
+        """
+        # The header table gets cleaned on every organize,
+        # so check if anything actually got shuffled.
+        headers_moved = self.sect_headers.moved_since_load()
+        dependents = dict()
+        todo = list()
+        for sheader in self.sect_headers:
+            if sheader.pending is not None:
+                continue
+            section = sheader.section
+            if section.dirty or (headers_moved and getattr(section, 'header_refs', False)):
+                todo.append(sheader)
+            for dep in section.get_dependencies():
+                dependents.setdefault(dep, list()).append(sheader)
+
+        stale = set(todo)
+        while len(todo) != 0:
+            sheader = todo.pop()
+            for dependent in dependents.get(sheader, ()):
+                if dependent not in stale:
+                    stale.add(dependent)
+                    todo.append(dependent)
+        return stale
+
+    def mark_clean(self):
+        """
+        Note that the file matches what was last loaded or saved.
+        """
+        self.prog_headers.dirty = False
+        self.sect_headers.dirty = False
+        for sheader in self.sect_headers:
+            if sheader.pending is None:
+                sheader.section.dirty = False
+
+    def settle_references(self):
+        """
+        Make sure nothing will be written from stale raw values.
+
+        Pending sections and records that haven't resolved their
+        references yet are written back exactly as they were loaded.
+        If something they point at has moved, they get decoded now.
+        """
+        self.sect_headers.load_dependents()
+        for sheader in self.sect_headers:
+            if sheader.pending is None and isinstance(sheader.section, TableUnderlay):
+                sheader.section.settle_references()
 
     def organize(self):
+        # Resolving references can grow the sections they
+        # point into, so get that out of the way before
+        # the file header decides where everything goes.
+        self.settle_references()
         self.e_header.organize(self)
-        for sect in map(lambda x: x.section, self.sect_headers):
-            sect.organize(self)
+        sizes = [ sheader.sh_size for sheader in self.sect_headers ]
+
+        # Organizing a section can change or move things other
+        # sections depend on, so keep going until nothing
+        # new needs decoding or goes stale.
+        organized = set()
+        while True:
+            self.settle_references()
+            stale = self.stale_sections()
+            todo = [ sheader for sheader in self.sect_headers if sheader in stale and sheader not in organized ]
+            if len(todo) == 0:
+                break
+            # Anything that shuffles symbols goes first,
+            # so tables built from them see the final order.
+            todo.sort(key=lambda x: not getattr(x.section, 'reorders_symbols', False))
+            for sheader in todo:
+                organized.add(sheader)
+                sheader.section.organize(self)
+
+        # If anything grew after the file header placed things, redo it.
+        if len(sizes) != len(self.sect_headers) or any(sheader.sh_size > size for (sheader, size) in zip(self.sect_headers, sizes)):
+            self.e_header.organize(self)
         self.sect_headers.organize(self)
         self.prog_headers.organize(self)
         
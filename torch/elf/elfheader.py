@@ -129,7 +129,11 @@ class ELFFileHeader(ReferenceUnderlay,
             out = False
 
         # Verify that the program headers and section headers don't overlap a section.
-        for sheader in elffile.sect_headers:
+        # Only look at the sections that could, in table order.
+        layout = elffile.get_layout()
+        overlapping = set(layout.sect_offsets.overlapping(ph_start, ph_end))
+        overlapping.update(layout.sect_offsets.overlapping(sh_start, sh_end))
+        for sheader in sorted(overlapping, key=lambda x: x.idx):
             sect_range = (sheader.sh_offset, sheader.sh_offset + sheader.sh_size)
             sect_str = self.range_string(sect_range[0], sect_range[1])
             if self.range_overlap(ph_range, sect_range):
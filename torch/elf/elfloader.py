@@ -1,12 +1,17 @@
 # Copyright (c) 2020 Raytheon BBN Technologies, Inc.  All Rights Reserved.
 # This document does not contain technology or Technical Data controlled under either
 # the  U.S. International Traffic in Arms Regulations or the U.S. Export Administration
+import mmap
+import os
 import pathlib
 from ..scripting.loader import *
-from .elffile import ELFFile
+from .elffile import ELFFile, verify_levels
 from .elfmanipulation import *
 
 class ELFLoader(Loader):
+    load_modes = frozenset([ 'LAZY' ])
+    snapshots = True
+
     @classmethod
     def static_init(cls):
         super(ELFLoader, cls).static_init('ELF')
@@ -14,11 +19,24 @@ class ELFLoader(Loader):
     def __init__(self):
         self.binary = ELFFile()
         self.loaded = False
+        self.mapped = False
+
+    def load(self, data, *modes):
+        if self.loaded:
+            return "Loader already contains a binary."
+        self.binary.from_bytes(data, lazy=('LAZY' in modes))
+        self.mapped = isinstance(data, mmap.mmap)
+        self.loaded = True
+
+    def get_snapshot(self):
+        return self.binary
 
-    def load(self, data):
+    def load_snapshot(self, snapshot):
         if self.loaded:
             return "Loader already contains a binary."
-        self.binary.from_bytes(data)
+        # Snapshots hold copies, never views into a mapping.
+        self.binary = snapshot
+        self.mapped = False
         self.loaded = True
 
     ##############
@@ -26,11 +44,17 @@ class ELFLoader(Loader):
     ##############
 
     @command
-    @help('Save the image to <path>', args=['path'], errors=[
+    @help('Save the image to <path>.',
+            '<level> picks how much to verify first: "NONE",',
+            '"STRUCTURAL" (headers, overlaps and alignment),',
+            'or "FULL" (also hash tables, versions and strings).',
+            'Defaults to the --verify option.',
+            args=['path', 'overwrite', 'level'], errors=[
         'Fails if the path already exists.',
         'Fails if there is no image loaded.',
+        'Fails if <level> is not a known verification level.',
         'Fails if the image fails verification.'])
-    def save(self, path, overwrite):
+    def save(self, path, overwrite, level=''):
         overwrite = (overwrite == "OVERWRITE")
         path = pathlib.Path(path)
         if path.exists() and not overwrite:
@@ -39,15 +63,33 @@ class ELFLoader(Loader):
         if not self.loaded:
             return "No binary loaded."
 
+        level = level.upper()
+        if level == '':
+            level = self.verify_level
+        if level not in verify_levels:
+            return "Unknown verification level: {:s}".format(level)
+
         self.l.info('Path: "{!s}"'.format(path))
 
         self.binary.organize()
-        if not self.binary.verify():
+        if not self.binary.verify(jobs=self.jobs, level=level):
             return "Binary failed verification."
 
-        with open(path, 'wb+') as f:
-            self.binary.to_bytes(f)
+        if self.mapped and path.exists():
+            # Untouched sections are still views into the input mapping.
+            # If we're overwriting the input, truncating it would
+            # pull the data out from under us, so write a copy
+            # and swap it into place.
+            tmp_path = path.with_name(path.name + '.torch-tmp')
+            with open(tmp_path, 'wb+') as f:
+                self.binary.to_bytes(f)
+            os.replace(tmp_path, path)
+        else:
+            with open(path, 'wb+') as f:
+                self.binary.to_bytes(f)
         path.chmod(0o744)
+        # Later saves only need to redo whatever changes after this.
+        self.binary.mark_clean()
 
     @command
     @help('Pretty print <section>', args=['section'], errors=[
@@ -104,6 +146,25 @@ class ELFLoader(Loader):
         if set_symbol_library_version(self.binary, symbol_name, version, permissive):
             self.l.info("Reset library version for {:s} to {:d}".format(symbol_name, version))
 
+    @command
+    @help('Set the library versions of many dynamic symbols at once,',
+            'reading "symbol,version" lines from <path>.',
+            'Same as one SET_SYMBOL_VERSION per line,',
+            'but every line is checked before anything changes.',
+            '<permissive> works the same way, too.',
+            args=['path', 'permissive'],
+            errors=[
+                'Fails if <path> cannot be read, or a line is not a symbol and a version.',
+                'Fails if any symbol does not exist in .dynsym and set to STRICT.',
+                'Fails if any version is not a 16-bit positive int, or not a valid library version.',
+                'Fails if there is no .dynamic section in the binary.',
+                'Fails if the .dynamic section does not contain expected version data.' ])
+    def set_symbol_versions(self, path, permissive):
+        permissive = (permissive == 'PERMISSIVE')
+        versions = read_symbol_versions(path)
+        count = set_symbol_library_versions(self.binary, versions, permissive)
+        self.l.info("Reset library versions for {:d} of {:d} symbols from {:s}".format(count, len(versions), path))
+
 
     @command
     def move_section(self, section_name, alignment):
@@ -124,4 +185,64 @@ class ELFLoader(Loader):
         if add_dynamic_tag(self.binary, tag_name, val_str):
             self.l.info('Added a dynamic tag {:s}: {:s}'.format(tag_name, val_str))
 
+    @command
+    @help('Add a dynamic tag for each line of <path>.',
+            'Each line is a tag name and a string value, like "DT_NEEDED,libfoo.so".',
+            'Blank lines and lines starting with "#" are skipped.',
+            'Same as one MAKE_DYN_TAG per line, but .dynamic and .dynstr',
+            'only get laid out once.',
+            args=['path'],
+            errors=[
+                'Fails if <path> cannot be read.',
+                'Fails if a line is not a tag name and a value.',
+                'Fails if any tag name is unknown; no tags get added.',
+                'Fails if there is no .dynamic section in the binary.' ])
+    def make_dyn_tags(self, path):
+        tags = read_dynamic_tags(path)
+        if add_dynamic_tags(self.binary, tags):
+            self.l.info('Added {:d} dynamic tags from {:s}'.format(len(tags), path))
+
+    @command
+    @help('Re-size the GNU hash table <section> for the symbols it holds now,',
+            'using the same heuristics as GNU ld, and rebuild it.',
+            'Sizes that are already at least that big (say, from ld -O1)',
+            'are kept, unless <shrink> is "SHRINK".',
+            'Logs bucket chain lengths and the estimated bloom filter',
+            'false positive rate from before and after.',
+            args=['section', 'shrink'],
+            errors=[
+                'Fails if there is no section matching the name.',
+                'Fails if the section is not a GNU hash table.',
+                'Fails if <shrink> is given and is not "SHRINK".' ])
+    def resize_gnu_hash(self, section, shrink=''):
+        shrink = shrink.upper()
+        if shrink not in ('', 'SHRINK'):
+            return "Unknown resize option: {:s}".format(shrink)
+        (resized, before, after) = resize_gnu_hash_table(self.binary, section, shrink=(shrink == 'SHRINK'))
+        if not resized:
+            self.l.info('{:s} is already at least as big as ld would make it; not resizing.'.format(section))
+            for line in before:
+                self.l.info('\t{:s}'.format(line))
+            return
+        self.l.info('Lookups in {:s} before resizing:'.format(section))
+        for line in before:
+            self.l.info('\t{:s}'.format(line))
+        self.l.info('Lookups in {:s} after resizing:'.format(section))
+        for line in after:
+            self.l.info('\t{:s}'.format(line))
+
+    @command
+    @help('Add a GNU hash table to a binary that only has a SysV one,',
+            'so the dynamic loader can use bloom-filtered lookups.',
+            'The new .gnu.hash section goes in the slack after a read-only',
+            'loadable segment, which is extended to cover it,',
+            'and gets a DT_GNU_HASH tag.',
+            errors=[
+                'Fails if the binary already has a GNU hash table or DT_GNU_HASH tag.',
+                'Fails if the binary has no DT_HASH tag.',
+                'Fails if there is no room after any read-only loadable segment.' ])
+    def make_gnu_hash(self):
+        sheader = make_gnu_hash_table(self.binary)
+        self.l.info('Added .gnu.hash at {:x}/{:x} with {:d} buckets'.format(sheader.sh_offset, sheader.sh_addr, sheader.section.nbuckets))
+
 ELFLoader.static_init()
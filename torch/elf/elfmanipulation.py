@@ -2,16 +2,17 @@
 # This document does not contain technology or Technical Data controlled under either
 # the  U.S. International Traffic in Arms Regulations or the U.S. Export Administration
 from .sections.dynamic import *
-from .sections.strtab import ELFStrItem
-from .pheader import ELFProgramHeader
+from .sections.gnu_hash import ELFGNUHashSection, ld_hash_parameters
+from .pheader import ELFProgramHeader, PT_LOAD
+from .sheader import ELFSectionHeader, SHT_NOBITS, SHT_GNU_HASH
+from .layout import SHF_ALLOC
 from functools import reduce
 
 def find_section_by_name(elffile, section_name, permissive):
     section = None
-    for item in elffile.sect_headers:
-        if item.get_referenced_object('sh_name') == section_name:
-            section = item.section
-            break
+    item = elffile.sect_headers.find_sect_header_by_name(section_name)
+    if item is not None:
+        section = item.section
     if section is None:
         if not permissive:
             raise ValueError('Missing section named {:s}'.format(section_name))
@@ -23,10 +24,9 @@ def get_symbol_from_table(elffile, symbol_name, table_name, permissive):
     symtab = find_section_by_name(elffile, table_name, permissive)
     if symtab is None:
         return None
-    for symbol in symtab:
-        name = symbol.get_referenced_object('st_name')
-        if name == symbol_name:
-            return symbol
+    symbol = symtab.get_symbol_by_name(symbol_name)
+    if symbol is not None:
+        return symbol
     if not permissive:
         raise ValueError('Missing symbol {:s} in {:s}'.format(symbol_name, table_name))
     else:
@@ -39,16 +39,10 @@ def rename_symbol_in_table(elffile, old_name, new_name, table_name, permissive):
     symbol.get_referenced_object('st_name').from_string(new_name) 
     return True
 
-def set_symbol_library_version(elffile, symbol_name, version, permissive):
-    if version < 0 or version >= 2**16:
-        raise ValueError('Version is outside allowed range (16-bit positive int): {:d}'.format(version))
-
-    # Find the symbol
-    symbol = get_symbol_from_table(elffile, symbol_name, '.dynsym', permissive)
-    if symbol is None:
-        return False
-
-    # Find the versym and verneed sections from the .dynamic section
+def get_version_tables(elffile):
+    """
+    Find the verneed and versym sections from the .dynamic section.
+    """
     dynamic = find_section_by_name(elffile, '.dynamic', False)
     verneed_tags = dynamic.get_tags_by_id(DT_VERNEED)
     versym_tags = dynamic.get_tags_by_id(DT_VERSYM)
@@ -63,20 +57,220 @@ def set_symbol_library_version(elffile, symbol_name, version, permissive):
 
     verneed = verneed_tag.get_referenced_object('d_ptr_verneed').section
     versym = versym_tag.get_referenced_object('d_ptr_versym').section
+    return (verneed, versym)
+
+def set_symbol_library_version(elffile, symbol_name, version, permissive):
+    return set_symbol_library_versions(elffile, [ (symbol_name, version) ], permissive) != 0
 
-    # Check that the new version ID is valid.
-    good = False
-    if version != 0 and version != 1:
-        for entry in verneed:
-            for aux in entry.aux:
-                if aux.vna_other == version:
-                    good = True
-                    break
-        if not good:
+def set_symbol_library_versions(elffile, versions, permissive):
+    """
+    Set the library version of each symbol in <versions>, a list of (symbol_name, version).
+
+    Everything gets checked before anything changes.
+    Symbols missing from .dynsym are skipped if <permissive>.
+    Returns how many symbols got set.
+    """
+    for (symbol_name, version) in versions:
+        if version < 0 or version >= 2**16:
+            raise ValueError('Version is outside allowed range (16-bit positive int): {:d}'.format(version))
+
+    (verneed, versym) = get_version_tables(elffile)
+
+    # Check that the new version IDs are valid.
+    for (symbol_name, version) in versions:
+        if not verneed.has_version(version):
             raise ValueError('Unknown version id: {:d}'.format(version))
 
-    versym[symbol.idx].assign(version)
-    return True
+    # Find the symbols
+    symbols = list()
+    for (symbol_name, version) in versions:
+        symbol = get_symbol_from_table(elffile, symbol_name, '.dynsym', permissive)
+        if symbol is not None:
+            symbols.append((symbol, version))
+
+    for (symbol, version) in symbols:
+        versym[symbol.idx].assign(version)
+    return len(symbols)
+
+def read_symbol_versions(path):
+    """
+    Read (symbol_name, version) pairs from a file, one "symbol,version" per line.
+    """
+    versions = list()
+    with open(path, 'r') as f:
+        for (lineno, line) in enumerate(f, 1):
+            line = line.strip()
+            if line == '' or line.startswith('#'):
+                continue
+            entry = line.rsplit(',', 1)
+            if len(entry) != 2:
+                raise ValueError('Expected symbol,version on line {:d} of {!s}: {:s}'.format(lineno, path, line))
+            try:
+                version = int(entry[1])
+            except ValueError:
+                raise ValueError('Bad version on line {:d} of {!s}: {:s}'.format(lineno, path, entry[1]))
+            versions.append((entry[0], version))
+    return versions
+
+def resize_gnu_hash_table(elffile, section_name, shrink=False):
+    section = find_section_by_name(elffile, section_name, False)
+    if not isinstance(section, ELFGNUHashSection):
+        raise ValueError('Section {:s} is not a GNU hash table'.format(section_name))
+    return section.resize(shrink=shrink)
+
+def make_gnu_hash_table(elffile):
+    """
+    Give a binary that only has a SysV hash table a GNU one, too.
+
+    The new .gnu.hash section goes in the slack after the end of
+    a read-only loadable segment, which gets extended to cover it,
+    and gets a DT_GNU_HASH tag.  There's no moving the program
+    headers to make room for a whole new segment.
+
+    Returns the new section's header.
+    """
+    sect_headers = elffile.sect_headers
+    dynamic = find_section_by_name(elffile, '.dynamic', False)
+    if len(dynamic.get_tags_by_id(DT_GNU_HASH)) != 0:
+        raise ValueError('Binary already has a DT_GNU_HASH tag')
+    for sheader in sect_headers:
+        if sheader.sh_type == SHT_GNU_HASH:
+            raise ValueError('Binary already has a GNU hash table: {!s}'.format(sheader))
+    if len(dynamic.get_tags_by_id(DT_HASH)) == 0:
+        raise ValueError('Binary has no DT_HASH tag')
+    dynsym = dynamic.find_section_by_ptr_tag(DT_SYMTAB)
+
+    # Anything earlier commands grew has to be given its room
+    # before we go looking for slack after it.
+    elffile.organize()
+
+    # Build the section first, so we know how big it is.
+    # Until it's placed, the header holds raw values.
+    sheader = ELFSectionHeader(0, 0, sect_headers)
+    sheader.from_dict({
+        'sh_name': 0,
+        'sh_type': SHT_GNU_HASH,
+        'sh_flags': SHF_ALLOC,
+        'sh_addr': 0,
+        'sh_offset': 0,
+        'sh_size': 0,
+        'sh_link': dynsym.idx,
+        'sh_info': 0,
+        'sh_addralign': elffile.wordsize,
+        'sh_entsize': 0
+    })
+    section = ELFGNUHashSection(sheader=sheader, byteorder=elffile.byteorder, wordsize=elffile.wordsize)
+    nsyms = len(list(filter(section.gnu_need_hash, dynsym.section.items)))
+    (nbuckets, bloomsize, bloomshift) = ld_hash_parameters(nsyms, elffile.wordsize)
+    section.from_dict({
+        'nbuckets': nbuckets,
+        'symoffset': 0,
+        'bloomsize': bloomsize,
+        'bloomshift': bloomshift
+    })
+    section.organize()
+    section.oldsymoffset = section.symoffset
+    sheader.section = section
+
+    (segment, offset) = find_segment_slack(elffile, section.size, sheader.sh_addralign, dynsym)
+    sheader.sh_offset = offset
+    sheader.sh_addr = segment.p_vaddr + (offset - segment.p_offset)
+    segment.p_filesz = offset + section.size - segment.p_offset
+    segment.p_memsz = segment.p_filesz
+    elffile.prog_headers.layout_changed()
+
+    # Now it's placed, hook it up like a loaded header.
+    shstrtab = elffile.e_header.get_referenced_object('e_shstrndx').section
+    sheader.add_reference('off_references', 'sh_name', shstrtab.intern_string('.gnu.hash'))
+    sheader.add_reference('idx_references', 'sh_link', dynsym)
+    sheader.add_reference('field_references', 'sh_size', (sheader, 'section_size'))
+    for name in ('sh_name', 'sh_link', 'sh_size'):
+        delattr(sheader, name)
+    sheader.root = elffile
+    sect_headers.items.append(sheader)
+    shstrtab.clean()
+    sect_headers.clean()
+
+    entry = ELFDynamicEntry(0, 0, dynamic)
+    entry.from_dict({
+        'd_tag': DT_GNU_HASH,
+        'd_ptr_gnu_hash': sheader.sh_addr
+    })
+    entry.add_reference('field_references', 'd_ptr_gnu_hash', (sheader, 'sh_addr'))
+    delattr(entry, 'd_ptr_gnu_hash')
+    # The tag goes after the last real tag, in front of the DT_NULLs.
+    # Linkers leave spare DT_NULLs at the end; use them up,
+    # so .dynamic doesn't grow into whatever follows it.
+    size = dynamic.size
+    idx = len(dynamic.items)
+    while idx > 0 and dynamic.items[idx - 1].d_tag == DT_NULL:
+        idx -= 1
+    dynamic.items.insert(idx, entry)
+    dynamic.clean()
+    while dynamic.size > size and dynamic.items[-1].d_tag == DT_NULL and dynamic.items[-2].d_tag == DT_NULL:
+        dynamic.items.pop()
+        dynamic.clean()
+
+    return sheader
+
+def find_segment_slack(elffile, size, align, near):
+    """
+    Find room for <size> bytes right after a read-only loadable segment.
+
+    The room has to be free in the file and in memory,
+    and can't touch any page another loadable segment uses
+    that the segment didn't already.
+    Segments holding the section <near> get tried first.
+
+    Returns (segment, offset).
+    """
+    layout = elffile.get_layout()
+    e_header = elffile.e_header
+    ph_start = e_header.e_phoff
+    ph_end = ph_start + e_header.e_phentsize * e_header.e_phnum
+    loads = [ seg for seg in elffile.prog_headers if seg.p_type == PT_LOAD ]
+    # PF_W is 0x2.
+    candidates = [ seg for seg in loads if seg.p_flags & 0x2 == 0 and seg.p_filesz == seg.p_memsz ]
+    candidates.sort(key=lambda x: not (x.p_offset <= near.sh_offset < x.p_offset + x.p_filesz))
+
+    for segment in candidates:
+        start = segment.p_offset + segment.p_filesz
+        if start % align != 0:
+            start += align - (start % align)
+        end = start + size
+        addr = segment.p_vaddr + (start - segment.p_offset)
+        addr_end = addr + size
+
+        if any(sect.sh_type != SHT_NOBITS for sect in layout.sect_offsets.overlapping(start, end)):
+            continue
+        if len(layout.sect_addrs.overlapping(addr, addr_end)) != 0:
+            continue
+        if ph_start < end and ph_end > start:
+            continue
+        if any(seg is not segment for seg in layout.seg_offsets.overlapping(start, end)):
+            continue
+        if any(seg is not segment for seg in layout.seg_addrs.overlapping(addr, addr_end)):
+            continue
+
+        # Pages the segment maps now, and would map after.
+        page = max(segment.p_align, 1)
+        old_end = segment.p_vaddr + segment.p_memsz
+        old_pages = (old_end + page - 1) // page
+        new_pages = (addr_end + page - 1) // page
+        clash = False
+        for other in loads:
+            if other is segment:
+                continue
+            other_start = other.p_vaddr // page
+            other_end = (other.p_vaddr + other.p_memsz + page - 1) // page
+            if other_start < new_pages and other_end > old_pages:
+                clash = True
+                break
+        if clash:
+            continue
+        return (segment, start)
+
+    raise ValueError('No room for {:d} bytes after any read-only loadable segment'.format(size))
 
 def move_section_to_end(elffile, section_name, alignment):
     # For now, this is the only sane way I can think to move a section.
@@ -165,6 +359,7 @@ def move_segment_for_sections(elffile, segment_idx, start_name, end_name):
     segment.p_paddr = start_sect.sh_addr
     segment.p_filesz = end_sect.sh_offset + end_sect.sh_size - start_sect.sh_offset
     segment.p_memsz = end_sect.sh_addr + end_sect.sh_size - start_sect.sh_addr
+    elffile.prog_headers.layout_changed()
     
     print('Moving segment {:d} from 0x{:x}/0x{:x} to 0x{:x}/0x{:x}'.format(segment_idx, old_start, old_end, segment.p_vaddr, segment.p_vaddr + segment.p_memsz))
 
@@ -224,41 +419,69 @@ def add_segment_for_sections(elffile, segment_type, segment_flags, segment_align
     elffile.prog_headers.insert(idx, pheader)
     elffile.prog_headers.clean()
 
-def add_dynamic_tag(elffile, tag_name, val_str):
-    # Get the dynamic metadata section
-    sect_header = elffile.sect_headers.get_sect_header_by_name('.dynamic')
-    dynamic = sect_header.section
-    dynstr = dynamic.find_section_by_ptr_tag(DT_STRTAB).section
-
+def get_dynamic_tag_field(elffile, tag_name):
     if tag_name not in dt_vals:
         raise ValueError('Unknown dynamic tag {:s}'.format(tag_name))
 
     val_field_name = 'd_val_{:s}'.format(tag_name.lower().replace('dt_', ''))
     ptr_field_name = 'd_ptr_{:s}'.format(tag_name.lower().replace('dt_', ''))
+    ELFDynamicEntry.ensure_static_init()
     if val_field_name in ELFDynamicEntry.names[elffile.wordsize]:
-        field_name = val_field_name
+        return val_field_name
     elif ptr_field_name in ELFDynamicEntry.names[elffile.wordsize]:
-        field_name = ptr_field_name
+        return ptr_field_name
     else:
         raise ValueError('Could not reconstruct a field name for {:s}: tried {:s} and {:s}'.format(tag_name, val_field_name, ptr_field_name))
 
-    str_offset = None
-    for item in dynstr:
-        if item == val_str:
-            str_offset = item.offset
-            break
-
-    if str_offset is None:
-        new_str = ELFStrItem(b'\x00', 0, 0, dynstr)
-        dynstr.items.append(new_str)
-        new_str.from_string(val_str)
-        str_offset = new_str.offset
-
-    tag_data = {
-        'd_tag': dt_vals[tag_name],
-        field_name: str_offset
-    }
-    new_tag = ELFDynamicEntry(0, 0, dynamic)
-    new_tag.from_dict(tag_data)
-    dynamic.items.insert(0, new_tag)
+def add_dynamic_tag(elffile, tag_name, val_str):
+    return add_dynamic_tags(elffile, [ (tag_name, val_str) ])
+
+def add_dynamic_tags(elffile, tags):
+    """
+    Add a string-valued dynamic tag for each (tag_name, val_str) in <tags>.
+
+    Each tag goes in front of the ones before it,
+    same as adding them one at a time.
+    Strings already in .dynstr get reused.
+    .dynamic and .dynstr only get laid out once, at the end.
+    """
+    # Get the dynamic metadata section
+    sect_header = elffile.sect_headers.get_sect_header_by_name('.dynamic')
+    dynamic = sect_header.section
+    dynstr = dynamic.find_section_by_ptr_tag(DT_STRTAB).section
+
+    # Check everything before changing anything.
+    fields = [ get_dynamic_tag_field(elffile, tag_name) for (tag_name, val_str) in tags ]
+
+    new_tags = list()
+    for ((tag_name, val_str), field_name) in zip(tags, fields):
+        str_offset = dynstr.intern_string(val_str).offset
+        tag_data = {
+            'd_tag': dt_vals[tag_name],
+            field_name: str_offset
+        }
+        new_tag = ELFDynamicEntry(0, 0, dynamic)
+        new_tag.from_dict(tag_data)
+        new_tags.append(new_tag)
+
+    new_tags.reverse()
+    dynamic.items[0:0] = new_tags
+    dynstr.clean()
     dynamic.clean()
+    return len(new_tags) != 0
+
+def read_dynamic_tags(path):
+    """
+    Read (tag_name, val_str) pairs from a file, one "TAG,value" per line.
+    """
+    tags = list()
+    with open(path, 'r') as f:
+        for (lineno, line) in enumerate(f, 1):
+            line = line.strip()
+            if line == '' or line.startswith('#'):
+                continue
+            entry = line.split(',', 1)
+            if len(entry) != 2:
+                raise ValueError('Expected TAG,value on line {:d} of {!s}: {:s}'.format(lineno, path, line))
+            tags.append((entry[0], entry[1]))
+    return tags
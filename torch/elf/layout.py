@@ -0,0 +1,71 @@
+# Copyright (c) 2020 Raytheon BBN Technologies, Inc.  All Rights Reserved.
+# This document does not contain technology or Technical Data controlled under either
+# the  U.S. International Traffic in Arms Regulations or the U.S. Export Administration
+from ..base.util import IntervalIndex
+from .sheader import SHT_NOBITS
+from .pheader import PT_LOAD
+
+SHF_ALLOC = 0x02
+
+class ELFLayout:
+    """
+    Where everything in an ELF file sits, in the file and in memory.
+
+    Holds interval indexes over the section headers,
+    by sh_offset and by sh_addr, and the program headers,
+    by p_offset and by p_vaddr.
+    Only sections that get loaded (SHF_ALLOC) have addresses.
+
+    It's a snapshot; ELFFile.get_layout() hands out a new one
+    whenever the header tables' generations move on.
+    """
+    def __init__(self, elffile, generation):
+        self.generation = generation
+        sheaders = list(elffile.sect_headers)
+        pheaders = list(elffile.prog_headers)
+        self.sect_offsets = IntervalIndex([ (s.sh_offset, s.sh_offset + s.sh_size, s) for s in sheaders ])
+        self.sect_addrs = IntervalIndex([ (s.sh_addr, s.sh_addr + s.sh_size, s) for s in sheaders if s.sh_flags & SHF_ALLOC ])
+        self.seg_offsets = IntervalIndex([ (p.p_offset, p.p_offset + p.p_filesz, p) for p in pheaders ])
+        self.seg_addrs = IntervalIndex([ (p.p_vaddr, p.p_vaddr + p.p_memsz, p) for p in pheaders ])
+
+    def find_section_by_offset(self, off):
+        # NOBITS sections claim file space they don't use.
+        for sect in self.sect_offsets.covering(off):
+            if sect.sh_type != SHT_NOBITS:
+                return sect
+        return None
+
+    def find_section_by_addr(self, addr):
+        sects = self.sect_addrs.covering(addr)
+        if len(sects) == 0:
+            return None
+        return sects[0]
+
+    def find_segments_by_offset(self, off):
+        return self.seg_offsets.covering(off)
+
+    def find_segments_by_addr(self, addr):
+        return self.seg_addrs.covering(addr)
+
+    def vaddr_to_offset(self, addr):
+        """
+        Translate a virtual address to a file offset.
+
+        Returns None if no loadable segment maps the address
+        from the file (e.g.: it's in .bss).
+        """
+        for seg in self.seg_addrs.covering(addr):
+            if seg.p_type == PT_LOAD and addr < seg.p_vaddr + seg.p_filesz:
+                return seg.p_offset + (addr - seg.p_vaddr)
+        return None
+
+    def offset_to_vaddr(self, off):
+        """
+        Translate a file offset to a virtual address.
+
+        Returns None if no loadable segment maps the offset.
+        """
+        for seg in self.seg_offsets.covering(off):
+            if seg.p_type == PT_LOAD:
+                return seg.p_vaddr + (off - seg.p_offset)
+        return None
@@ -22,6 +22,19 @@ class ELFProgramTable(TableUnderlay,
         super().__init__()
         self.byteorder = byteorder
         self.wordsize = wordsize
+        # Bumped whenever segments move; see ELFFile.get_layout().
+        self.generation = 0
+
+    def clean(self, start=0):
+        super().clean(start)
+        self.layout_changed()
+
+    def item_changed(self, item):
+        super().item_changed(item)
+        self.layout_changed()
+
+    def layout_changed(self):
+        self.generation += 1
 
     def verify(self, *args):
         out = True
@@ -70,7 +83,12 @@ class ELFProgramTable(TableUnderlay,
                 segment.p_memsz = dyn_sect.sh_size
 
             else:
-                for section in elffile.sect_headers:
+                # Sections that start inside the segment,
+                # or start before it and end inside it.
+                layout = elffile.get_layout()
+                overlapping = layout.sect_offsets.starting_in(off_start, off_end) + layout.sect_offsets.entering(off_start, off_end)
+                overlapping.sort(key=lambda x: x.idx)
+                for section in overlapping:
                     sect_start = section.sh_offset
                     sect_end = sect_start + section.sh_size
 
@@ -94,8 +112,9 @@ class ELFProgramTable(TableUnderlay,
                             segment.p_paddr += diff
                             segment.p_filesz -= diff
                             segment.p_memsz -= diff
-            
-                
+
+        self.layout_changed()
+
 
 class ELFProgramHeader(ItemUnderlay,
                        PPrintUnderlay,
@@ -3,6 +3,7 @@
 # the  U.S. International Traffic in Arms Regulations or the U.S. Export Administration
 from .dynamic import *
 from .gnu_hash import *
+from .hash import *
 from .nobits import *
 from .progbits import *
 from .rela import *
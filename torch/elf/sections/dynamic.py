@@ -2,6 +2,7 @@
 # This document does not contain technology or Technical Data controlled under either
 # the  U.S. International Traffic in Arms Regulations or the U.S. Export Administration
 from ...base import *
+from ...base.util import LookupIndex
 from .section import *
 
 DT_NULL =           0x00
@@ -59,6 +60,7 @@ class ELFDynamicEntry(ItemUnderlay,
                       PPrintUnderlay,
                       StructUnderlay,
                       BaseObject):
+    __slots__ = ('sheader', 'dynamic')
 
     @classmethod
     def static_init(cls):
@@ -117,12 +119,16 @@ class ELFDynamicEntry(ItemUnderlay,
 
 
 
-ELFDynamicEntry.static_init()
+ELFDynamicEntry.defer_static_init()
 
 class ELFDynamicSection(TableUnderlay,
                         BaseObject,
                         ELFSection):
     types = frozenset([ 'DYNAMIC' ])
+    # Dynamic tags find sections by address, so they have to be
+    # matched up before anything moves.  There's not many of them.
+    lazy = False
+
     @classmethod
     def static_init(cls):
         super(ELFDynamicSection, cls).static_init(config_path='dynamic_table.tsf')
@@ -133,33 +139,43 @@ class ELFDynamicSection(TableUnderlay,
         self.sheader = sheader
         self.byteorder = byteorder
         self.wordsize = wordsize
+        # Tag id -> entries with that tag, in order.
+        self.tag_index = LookupIndex(self.tag_entries, multi=True)
 
     def organize(self, *args):
         self.clean()
 
+    def clean(self, start=0):
+        super().clean(start)
+        # Tags got inserted, removed or reordered.
+        self.tag_index.reset()
+
+    def item_changed(self, item):
+        super().item_changed(item)
+        self.tag_index.reset()
+
+    def tag_entries(self):
+        return ((item.d_tag, item) for item in self.items)
+
     def get_tags_by_id(self, tag_id):
-        out = list()
-        for item in self.items:
-            if item.d_tag == tag_id:
-                out.append(item)
-        return out
-    
-    def find_section_by_ptr_tag(self, tag_id):
-        for item in self.items:
-            if item.d_tag == tag_id:
-                section_tag = item
+        return list(self.tag_index.get(tag_id, ()))
 
-        if section_tag is None:
+    def find_section_by_ptr_tag(self, tag_id):
+        tags = self.get_tags_by_id(tag_id)
+        if len(tags) == 0:
             self.l.error("Could not find a tag number {:d} in the dynamic section.".format(tag_id))
             raise AttributeError("No tag identified")
+        # If a tag shows up more than once, the last one wins.
+        section_tag = tags[-1]
 
         field_name = dt_strings[tag_id].replace('DT_', 'd_ptr_').lower()
- 
-        for sect in self.sheader.parent:
-            if sect.sh_addr == getattr(section_tag, field_name):
-                return sect
+        addr = getattr(section_tag, field_name)
+        # Tags point at the start of their section.
+        sect = self.sheader.root.find_section_by_addr(addr)
+        if sect is not None and sect.sh_addr == addr:
+            return sect
 
-        self.l.error("Could not find a section matching address {:x}".format(section_tag.d_ptr))
+        self.l.error("Could not find a section matching address {:x}".format(addr))
         raise ValueError("No section matching pointer")
 
-ELFDynamicSection.static_init()
+ELFDynamicSection.defer_static_init()
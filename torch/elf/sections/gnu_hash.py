@@ -3,10 +3,21 @@
 # the  U.S. International Traffic in Arms Regulations or the U.S. Export Administration
 from ...base import *
 from .section import *
+from .hashing import *
+
+# Bucket counts GNU ld picks from when it isn't optimizing (bfd/elflink.c).
+elf_buckets = [ 1, 3, 17, 37, 67, 97, 131, 197, 263, 521, 1031, 2053, 4099, 8209, 16411, 32771 ]
+
 class ELFGNUHashSection(StructUnderlay,
                         BaseObject,
-                        ELFSection):
+                        ELFSection,
+                        SymbolHashes):
     types = frozenset([ 'GNU_HASH' ])
+    # Hashes depend on the symbols' names, not just where they sit.
+    link_contents = True
+    # Symbols that get hashed are sorted by bucket.
+    reorders_symbols = True
+
     @classmethod
     def static_init(cls):
         super(ELFGNUHashSection, cls).static_init(config_path='gnu_hash.tsf')
@@ -16,27 +27,33 @@ class ELFGNUHashSection(StructUnderlay,
         super().__init__(byteorder=byteorder, wordsize=wordsize)
         self.sheader = sheader
         self.symtab = sheader.parent[sheader.sh_link]
-        self.oldbloom = list()
-        self.oldbuckets = list()
-        self.oldchains = list()
-        self.bloom = list()
-        self.buckets = list()
-        self.chains = list()
+        self.oldbloom = self.new_array(wordsize)
+        self.oldbuckets = self.new_array(4)
+        self.oldchains = self.new_array(4)
+        self.bloom = self.new_array(wordsize)
+        self.buckets = self.new_array(4)
+        self.chains = self.new_array(4)
+        # Name -> hash; see SymbolHashes.
+        self.name_hashes = dict()
 
     def from_bytes(self, data):
         super().from_bytes(data)
         size = self.sheader.sh_size
         offset = 4 * 4
         self.oldsymoffset = self.symoffset
-        for i in range(0, self.bloomsize):
-            self.oldbloom.append(int.from_bytes(data[offset:offset+8], byteorder=self.byteorder))
-            offset += 8
-        for i in range(0, self.nbuckets):
-            self.oldbuckets.append(int.from_bytes(data[offset:offset+4], byteorder=self.byteorder))
-            offset += 4
-        while offset < size:
-            self.oldchains.append(int.from_bytes(data[offset:offset+4], byteorder=self.byteorder))
-            offset += 4
+        # Bloom words are the size of an address; everything else is 32 bits.
+        end = offset + self.bloomsize * self.wordsize
+        self.oldbloom = self.read_array(self.wordsize, data[offset:end])
+        offset = end
+        end = offset + self.nbuckets * 4
+        self.oldbuckets = self.read_array(4, data[offset:end])
+        offset = end
+        end = offset + ((size - offset) // 4) * 4
+        self.oldchains = self.read_array(4, data[offset:end])
+        # Until something changes, write back what we loaded.
+        self.bloom = self.new_array(self.wordsize, self.oldbloom)
+        self.buckets = self.new_array(4, self.oldbuckets)
+        self.chains = self.new_array(4, self.oldchains)
 
     def validate(self):
         temp_symoffset = self.symoffset
@@ -75,7 +92,9 @@ class ELFGNUHashSection(StructUnderlay,
         seen_chain_idxs = dict()
         seen_names = dict()
 
-        for symbol in self.symtab.section.items[self.symoffset:]:
+        symbols = self.symtab.section.items[self.symoffset:]
+        hashes = self.hash_symbols(symbols)
+        for (symbol, hsh) in zip(symbols, hashes):
 
             # Check symbol table integrity.
             name = '{!s}'.format(symbol)
@@ -85,11 +104,10 @@ class ELFGNUHashSection(StructUnderlay,
             else:
                 seen_names[name] = symbol.idx
 
-            hsh = self.gnu_hash(symbol)
-            bloom_idx = self.gnu_bloom_idx(symbol)
-            (bloom_a, bloom_b) = self.gnu_bloom_bits(symbol)
-            bucket_idx = self.gnu_bucket_idx(symbol)
-            
+            bloom_idx = self.hash_bloom_idx(hsh)
+            (bloom_a, bloom_b) = self.hash_bloom_bits(hsh)
+            bucket_idx = self.hash_bucket_idx(hsh)
+            chain_entry = self.hash_chain_entry(hsh)
 
             # Check bloom filter.
             bloom_elem = self.bloom[bloom_idx]
@@ -114,7 +132,7 @@ class ELFGNUHashSection(StructUnderlay,
             while True:
                 if chain_idx >= len(self.chains):
                     break
-                if self.chains[chain_idx] & 0xFFFFFFFE == self.gnu_chain_entry(symbol):
+                if self.chains[chain_idx] & 0xFFFFFFFE == chain_entry:
                     good = True
                     break
                 elif self.chains[chain_idx] & 1 != 0:
@@ -148,9 +166,9 @@ class ELFGNUHashSection(StructUnderlay,
                 chain_idx = 0
                 while True:
                     if chain_idx >= len(self.chains):
-                        self.l.error('Symbol {:d} ({!s}) is nowhere in the hash table; check your hash {:x}'.format(symbol.idx, symbol, self.gnu_hash(symbol)))
+                        self.l.error('Symbol {:d} ({!s}) is nowhere in the hash table; check your hash {:x}'.format(symbol.idx, symbol, hsh))
                         break;
-                    elif self.chains[chain_idx] & 0xFFFFFFFE == self.gnu_chain_entry(symbol):
+                    elif self.chains[chain_idx] & 0xFFFFFFFE == chain_entry:
                         self.l.error('Symbol {:d} ({!s}) had a hash match at idx {:d}, outside its expected bucket.'.format(symbol.idx, symbol, chain_idx))
                         break;
                     chain_idx += 1
@@ -160,42 +178,107 @@ class ELFGNUHashSection(StructUnderlay,
 
 
     def organize(self, *args):
-        self.bloom = [ 0 ] * self.bloomsize
-        self.buckets = [ 0 ] * self.nbuckets
+        self.dirty = True
+        nbuckets = self.nbuckets
+        bloomsize = self.bloomsize
+        bloomshift = self.bloomshift
+        wordbits = self.wordsize * 8
 
-        relevant_syms = list(filter(self.gnu_need_hash, self.symtab.section.items))
-        irrelevant_syms = list(filter(lambda x: not self.gnu_need_hash(x), self.symtab.section.items))
+        symbols = self.symtab.section.items
+        needed = list(map(self.gnu_need_hash, symbols))
+        relevant = [ i for (i, need) in enumerate(needed) if need ]
+        irrelevant = [ i for (i, need) in enumerate(needed) if not need ]
 
-        relevant_syms.sort(key=self.gnu_hash)
-        relevant_syms.sort(key=self.gnu_bucket_idx)
+        # Sort by bucket, and by hash within a bucket.
+        # Ties keep their order, same as two stable sorts.
+        hashes = self.hash_symbols(symbols[i] for i in relevant)
+        order = sorted(range(len(hashes)), key=lambda i: (hashes[i] % nbuckets, hashes[i]))
+        relevant = [ relevant[i] for i in order ]
+        hashes = [ hashes[i] for i in order ]
 
-        self.symoffset = len(irrelevant_syms)
-        self.symtab.section.items = irrelevant_syms + relevant_syms
-        self.symtab.section.clean()
-        
-        self.chains = list(map(self.gnu_chain_entry, relevant_syms))
+        self.symoffset = len(irrelevant)
+        self.reorder_symbols(irrelevant + relevant)
 
-        bucket_list = list(map(self.gnu_bucket_idx, relevant_syms))
-        bloom_idx_list = list(map(self.gnu_bloom_idx, relevant_syms))
-        bloom_bit_list = list(map(self.gnu_bloom_bits, relevant_syms))
+        bloom = [ 0 ] * bloomsize
+        buckets = [ 0 ] * nbuckets
+        chains = [ hsh & 0xFFFFFFFE for hsh in hashes ]
 
         last_bucket = -1
-        for i in range(0, len(bucket_list)):
+        for (i, hsh) in enumerate(hashes):
             # Update the buckets
-            if bucket_list[i] != last_bucket:
-                last_bucket = bucket_list[i]
-                self.buckets[last_bucket] = i + self.symoffset
+            bucket = hsh % nbuckets
+            if bucket != last_bucket:
+                last_bucket = bucket
+                buckets[bucket] = i + self.symoffset
                 # Mark end-of-chain elements.
                 if i > 0:
-                    self.chains[i - 1] = self.chains[i - 1] | 1
+                    chains[i - 1] |= 1
             # Update the bloom filter
-            bloom_idx = bloom_idx_list[i]
-            (bloom_a, bloom_b) = bloom_bit_list[i]
-            self.bloom[bloom_idx] |= (1 << bloom_a) | (1 << bloom_b)
+            bloom[(hsh // wordbits) % bloomsize] |= (1 << (hsh % wordbits)) | (1 << ((hsh >> bloomshift) % wordbits))
         # Mark the final end of chain element
-        if len(self.chains) > 0:
-            self.chains[-1] = self.chains[-1] | 1
-
+        if len(chains) > 0:
+            chains[-1] |= 1
+
+        self.bloom = self.new_array(self.wordsize, bloom)
+        self.buckets = self.new_array(4, buckets)
+        self.chains = self.new_array(4, chains)
+
+    def resize(self, shrink=False):
+        """
+        Pick new table sizes for the symbols we have now, and rebuild.
+
+        Sizes that are already bigger (ld -O1 makes them so)
+        are kept, unless <shrink> is set.
+        Returns whether it resized, and lookup reports from before and after.
+        """
+        hashes = self.hash_symbols(filter(self.gnu_need_hash, self.symtab.section.items))
+        before = self.lookup_report(hashes, self.nbuckets, self.bloomsize, self.bloomshift)
+        (nbuckets, bloomsize, bloomshift) = ld_hash_parameters(len(hashes), self.wordsize)
+        if not shrink:
+            if self.nbuckets >= nbuckets and self.bloomsize >= bloomsize:
+                return (False, before, before)
+            nbuckets = max(nbuckets, self.nbuckets)
+            if self.bloomsize > bloomsize:
+                (bloomsize, bloomshift) = (self.bloomsize, self.bloomshift)
+        (self.nbuckets, self.bloomsize, self.bloomshift) = (nbuckets, bloomsize, bloomshift)
+        self.organize()
+        after = self.lookup_report(hashes, self.nbuckets, self.bloomsize, self.bloomshift)
+        return (True, before, after)
+
+    def lookup_report(self, hashes, nbuckets, bloomsize, bloomshift):
+        """
+        Describe what lookups cost in a table of <hashes> with the given sizes.
+
+        Hits walk their chain up to their own entry.
+        Misses that get past the bloom filter walk their whole chain.
+        The false positive rate assumes names that aren't in
+        the table hash evenly, and that a word's two bits
+        are independent; it's an estimate.
+        """
+        wordbits = self.wordsize * 8
+        lengths = [ 0 ] * nbuckets
+        bloom = [ 0 ] * bloomsize
+        for hsh in hashes:
+            lengths[hsh % nbuckets] += 1
+            bloom[(hsh // wordbits) % bloomsize] |= (1 << (hsh % wordbits)) | (1 << ((hsh >> bloomshift) % wordbits))
+
+        nsyms = len(hashes)
+        histogram = dict()
+        for length in lengths:
+            histogram[length] = histogram.get(length, 0) + 1
+        if nsyms == 0:
+            hit_probes = 0.0
+        else:
+            hit_probes = sum(n * (n + 1) // 2 for n in lengths) / nsyms
+        miss_probes = nsyms / nbuckets
+        false_positives = sum((bin(word).count('1') / wordbits) ** 2 for word in bloom) / bloomsize
+
+        out = list()
+        out.append("{:d} symbols, {:d} buckets, {:d} bloom words, bloom shift {:d}".format(nsyms, nbuckets, bloomsize, bloomshift))
+        out.append("Chain lengths: {:s}".format(', '.join('{:d} x{:d}'.format(length, histogram[length]) for length in sorted(histogram))))
+        out.append("Longest chain {:d}; {:.2f} probes per hit, {:.2f} per miss past the bloom filter".format(max(lengths), hit_probes, miss_probes))
+        out.append("Estimated bloom false positive rate: {:.2%}".format(false_positives))
+        return out
 
     def pprint(self, am_organized=False):
         super().pprint()
@@ -211,16 +294,9 @@ class ELFGNUHashSection(StructUnderlay,
 
     def to_bytes(self, write):
         out = super().to_bytes(write)
-
-        for b in self.bloom:
-            write(b.to_bytes(self.wordsize, byteorder=self.byteorder))
-            out += self.wordsize
-        for b in self.buckets:
-            write(b.to_bytes(4, byteorder=self.byteorder))
-            out += 4
-        for c in self.chains:
-            write(c.to_bytes(4, byteorder=self.byteorder))
-            out += 4
+        out += self.write_array(write, self.bloom)
+        out += self.write_array(write, self.buckets)
+        out += self.write_array(write, self.chains)
         return out
 
     @property
@@ -235,33 +311,82 @@ class ELFGNUHashSection(StructUnderlay,
         #TODO: I think this is more complicated, but whatevs.
         return symbol.st_shndx != 0x00
 
+    def hash_name(self, name):
+        return gnu_hash_name(name)
+
     def gnu_hash(self, symbol):
-        out = 5381
-        for c in symbol.get_referenced_object('st_name'):
-            if c == 0:
-                break
-            out = (out << 5) + out + c
-            out &= 0xFFFFFFFF
-        return out
+        return self.symbol_hash(symbol)
 
     def gnu_bucket_idx(self, symbol):
-        return self.gnu_hash(symbol) % self.nbuckets
+        return self.hash_bucket_idx(self.gnu_hash(symbol))
 
     def gnu_chain_entry(self, symbol):
-        mask = (1 << 64) - 2
-        return self.gnu_hash(symbol) & mask
+        return self.hash_chain_entry(self.gnu_hash(symbol))
 
     def gnu_bloom_idx(self, symbol):
-        wordbits = self.wordsize * 8
-        return (self.gnu_hash(symbol) // wordbits) % self.bloomsize
+        return self.hash_bloom_idx(self.gnu_hash(symbol))
 
     def gnu_bloom_bits(self, symbol):
+        return self.hash_bloom_bits(self.gnu_hash(symbol))
+
+    def hash_bucket_idx(self, hsh):
+        return hsh % self.nbuckets
+
+    def hash_chain_entry(self, hsh):
+        # The low bit marks the end of a chain.
+        return hsh & 0xFFFFFFFE
+
+    def hash_bloom_idx(self, hsh):
+        wordbits = self.wordsize * 8
+        return (hsh // wordbits) % self.bloomsize
+
+    def hash_bloom_bits(self, hsh):
         wordbits = self.wordsize * 8
-        hsh = self.gnu_hash(symbol)
         unshift = hsh % wordbits
         shift = (hsh >> self.bloomshift) % wordbits
         return (unshift, shift)
 
-ELFGNUHashSection.static_init()
+def ld_hash_parameters(nsyms, wordsize):
+    """
+    Pick (nbuckets, bloomsize, bloomshift) for <nsyms> hashed symbols, like GNU ld.
+    """
+    if nsyms == 0:
+        # ld writes a special empty table.
+        return (1, 1, 0)
+
+    nbuckets = elf_buckets[0]
+    for size in elf_buckets[1:]:
+        if nsyms < size:
+            break
+        nbuckets = size
+    # Hash tables need at least two buckets.
+    nbuckets = max(nbuckets, 2)
+
+    # Bloom filter bits, as a power of two; floor(log2(nsyms)) + 1 to start.
+    maskbitslog2 = nsyms.bit_length()
+    if maskbitslog2 < 3:
+        maskbitslog2 = 5
+    elif (1 << (maskbitslog2 - 2)) & nsyms:
+        maskbitslog2 += 3
+    else:
+        maskbitslog2 += 2
+    if wordsize == 8:
+        if maskbitslog2 == 5:
+            maskbitslog2 = 6
+        wordbitslog2 = 6
+    else:
+        wordbitslog2 = 5
+    return (nbuckets, 1 << (maskbitslog2 - wordbitslog2), maskbitslog2)
+
+def gnu_hash_name(name):
+    """
+    The GNU (DJB) hash of <name>, as bytes, without the NUL.
+    """
+    out = 5381
+    for c in name:
+        out = (out * 33 + c) & 0xFFFFFFFF
+    return out
+
+ELFGNUHashSection.defer_static_init()
 
 
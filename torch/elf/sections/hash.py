@@ -0,0 +1,139 @@
+# Copyright (c) 2020 Raytheon BBN Technologies, Inc.  All Rights Reserved.
+# This document does not contain technology or Technical Data controlled under either
+# the  U.S. International Traffic in Arms Regulations or the U.S. Export Administration
+from ...base import *
+from .section import *
+from .hashing import *
+
+class ELFHashSection(StructUnderlay,
+                     BaseObject,
+                     ELFSection,
+                     SymbolHashes):
+    """
+    Old-style SysV symbol hash table (DT_HASH).
+
+    Every symbol but the first is in the table,
+    and the chains run parallel to the symbol table,
+    so it has to be rebuilt whenever the symbols
+    get renamed, added, or shuffled.
+    """
+    types = frozenset([ 'HASH' ])
+    # Hashes depend on the symbols' names, not just where they sit.
+    link_contents = True
+
+    @classmethod
+    def static_init(cls):
+        super(ELFHashSection, cls).static_init(config_path='hash.tsf')
+        cls.parse_config()
+
+    def __init__(self, sheader=None, byteorder='little', wordsize=4):
+        super().__init__(byteorder=byteorder, wordsize=wordsize)
+        self.sheader = sheader
+        self.symtab = sheader.parent[sheader.sh_link]
+        self.buckets = self.new_array(4)
+        self.chains = self.new_array(4)
+        # Name -> hash; see SymbolHashes.
+        self.name_hashes = dict()
+
+    def from_bytes(self, data):
+        super().from_bytes(data)
+        offset = 2 * 4
+        end = offset + self.nbucket * 4
+        self.buckets = self.read_array(4, data[offset:end])
+        offset = end
+        end = offset + self.nchain * 4
+        self.chains = self.read_array(4, data[offset:end])
+
+    def hash_name(self, name):
+        return elf_hash_name(name)
+
+    def verify(self, *args):
+        out = True
+        symbols = self.symtab.section.items
+
+        # Check basic metadata integrity.
+        if len(self.buckets) != self.nbucket:
+            self.l.error("Expected {:d} buckets, but found {:d}".format(self.nbucket, len(self.buckets)))
+            out = False
+        if self.nchain != len(symbols):
+            self.l.error("Expected {:d} chain entries for {:d} symbols, but the header says {:d}".format(len(symbols), len(symbols), self.nchain))
+            out = False
+        if len(self.chains) != self.nchain:
+            self.l.error("Expected {:d} chain entries, but found {:d}".format(self.nchain, len(self.chains)))
+            out = False
+        if not out or self.nbucket == 0:
+            return False
+
+        hashes = self.hash_symbols(symbols)
+        for idx in range(1, len(symbols)):
+            symbol = symbols[idx]
+            # Walk the chain like the loader would,
+            # giving up if it loops.
+            chain_idx = self.buckets[hashes[idx] % self.nbucket]
+            steps = 0
+            while chain_idx != 0 and chain_idx != idx and steps < len(self.chains):
+                if chain_idx >= len(self.chains):
+                    break
+                chain_idx = self.chains[chain_idx]
+                steps += 1
+            if chain_idx != idx:
+                self.l.error("Could not find symbol {:d} ({!s}) in its hash chain; check your hash {:x}".format(idx, symbol, hashes[idx]))
+                out = False
+        return out
+
+    def organize(self, *args):
+        self.dirty = True
+        symbols = self.symtab.section.items
+        nbucket = self.nbucket
+        if nbucket == 0:
+            nbucket = 1
+
+        buckets = [ 0 ] * nbucket
+        chains = [ 0 ] * len(symbols)
+        hashes = self.hash_symbols(symbols)
+        # Symbol 0 is the null symbol; it never gets looked up.
+        for idx in range(1, len(symbols)):
+            bucket = hashes[idx] % nbucket
+            chains[idx] = buckets[bucket]
+            buckets[bucket] = idx
+
+        self.nbucket = nbucket
+        self.nchain = len(symbols)
+        self.buckets = self.new_array(4, buckets)
+        self.chains = self.new_array(4, chains)
+
+    def pprint(self, am_organized=False):
+        super().pprint()
+        if not am_organized:
+            self.organize()
+        print("\tBuckets:")
+        for i in range(0, self.nbucket):
+            print("\t\t{:d}: {:d}".format(i, self.buckets[i]))
+        print("\tChains:")
+        for i in range(0, len(self.chains)):
+            print("\t\t{:d}: {:d}".format(i, self.chains[i]))
+
+    def to_bytes(self, write):
+        out = super().to_bytes(write)
+        out += self.write_array(write, self.buckets)
+        out += self.write_array(write, self.chains)
+        return out
+
+    @property
+    def size(self):
+        return 8 + (len(self.buckets) + len(self.chains)) * 4
+
+def elf_hash_name(name):
+    """
+    The SysV ELF hash of <name>, as bytes, without the NUL.
+    """
+    out = 0
+    for c in name:
+        out = (out << 4) + c
+        high = out & 0xF0000000
+        if high != 0:
+            out ^= high >> 24
+        out &= ~high & 0xFFFFFFFF
+    return out
+
+ELFHashSection.defer_static_init()
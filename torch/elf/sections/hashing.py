@@ -0,0 +1,107 @@
+# Copyright (c) 2020 Raytheon BBN Technologies, Inc.  All Rights Reserved.
+# This document does not contain technology or Technical Data controlled under either
+# the  U.S. International Traffic in Arms Regulations or the U.S. Export Administration
+import sys
+from array import array
+from ...base.underlays.columnar import column_typecodes
+
+class SymbolHashes:
+    """
+    Bits shared by the symbol hash table sections.
+
+    Hashes are cached by name, so a renamed symbol
+    just misses the cache, and symbols that share
+    a name share an entry.  Subclasses set up
+    self.name_hashes and provide hash_name().
+    The cache only keeps the names last hashed together,
+    so names renamed away don't pile up in it.
+
+    Tables are held in arrays, read and written
+    in one go, and only byteswapped if the file's
+    byte order isn't the host's.
+    """
+    def new_array(self, size, vals=()):
+        return array(column_typecodes[size], vals)
+
+    def read_array(self, size, data):
+        out = self.new_array(size)
+        out.frombytes(data)
+        if self.byteorder != sys.byteorder:
+            out.byteswap()
+        return out
+
+    def write_array(self, write, vals):
+        if self.byteorder != sys.byteorder:
+            vals = array(vals.typecode, vals)
+            vals.byteswap()
+        write(memoryview(vals).cast('B'))
+        return len(vals) * vals.itemsize
+
+    def symbol_name(self, symbol):
+        # Names stop at the first NUL.
+        name = bytes(symbol.get_referenced_object('st_name').data)
+        end = name.find(0)
+        if end != -1:
+            name = name[:end]
+        return name
+
+    def symbol_hash(self, symbol):
+        name = self.symbol_name(symbol)
+        hsh = self.name_hashes.get(name)
+        if hsh is None:
+            hsh = self.hash_name(name)
+            self.name_hashes[name] = hsh
+        return hsh
+
+    def hash_symbols(self, symbols):
+        """
+        Hash the names of <symbols>, in order, into an array.
+
+        The cache is rebuilt from just these names.
+        """
+        old = self.name_hashes
+        cache = dict()
+        out = self.new_array(4)
+        for symbol in symbols:
+            name = self.symbol_name(symbol)
+            hsh = cache.get(name)
+            if hsh is None:
+                hsh = old.get(name)
+                if hsh is None:
+                    hsh = self.hash_name(name)
+                cache[name] = hsh
+            out.append(hsh)
+        self.name_hashes = cache
+        return out
+
+    def find_versym(self):
+        """
+        Find the version table that runs parallel to our symbol table, or None.
+        """
+        for sheader in self.symtab.parent:
+            if sheader.get_enum('sh_type', sheader.sh_type) != 'VERSYM':
+                continue
+            try:
+                link = sheader.get_referenced_object('sh_link')
+            except AttributeError:
+                link = sheader.parent[sheader.sh_link]
+            if link is self.symtab:
+                return sheader.section
+        return None
+
+    def reorder_symbols(self, order):
+        """
+        Put the symbol table in <order>, a list of current indexes.
+
+        Version entries line up with symbols by index,
+        so the version table gets shuffled the same way.
+        """
+        symtab = self.symtab.section
+        versym = self.find_versym()
+        old_syms = list(symtab.items)
+        symtab.items = [ old_syms[i] for i in order ]
+        symtab.clean()
+        if versym is not None and len(versym) == len(old_syms):
+            old_vers = list(versym.items)
+            versym.items = [ old_vers[i] for i in order ]
+            versym.clean()
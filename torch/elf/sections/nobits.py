@@ -7,6 +7,9 @@ from .section import *
 class ELFNoBits(BaseObject,
                 ELFSection):
     types = frozenset([ 'NOBITS', 'NULL' ])
+    # Nothing to decode, and nothing to write back.
+    lazy = False
+
     @classmethod
     def static_init(cls):
         super(ELFNoBits, cls).static_init()
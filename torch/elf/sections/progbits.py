@@ -4,6 +4,9 @@
 from ...base import *
 
 class ELFProgBits(BaseObject):
+    # Raw bits never change in place.
+    dirty = False
+
     @classmethod
     def static_init(cls):
         super(ELFProgBits, cls).static_init()
@@ -27,6 +30,9 @@ class ELFProgBits(BaseObject):
     def resolve_references(self):
         pass
 
+    def get_dependencies(self):
+        return list()
+
     @property
     def size(self):
         return len(self.data)
@@ -34,4 +40,4 @@ class ELFProgBits(BaseObject):
     def pprint(self):
         print("ELFProgBits[ {:d} bytes ]".format(len(self.data)))
 
-ELFProgBits.static_init()
+ELFProgBits.defer_static_init()
@@ -9,6 +9,8 @@ class ELFRelaEntry(ItemUnderlay,
                    PPrintUnderlay,
                    StructUnderlay,
                    BaseObject):
+    __slots__ = ()
+
     @classmethod
     def static_init(cls):
         super(ELFRelaEntry, cls).static_init(config_path='rela.tsf')
@@ -31,7 +33,7 @@ class ELFRelaEntry(ItemUnderlay,
     def organize(self, *args):
         pass
 
-ELFRelaEntry.static_init()
+ELFRelaEntry.defer_static_init()
 
 class ELFRelaSection(TableUnderlay,
                      BaseObject,
@@ -52,4 +54,4 @@ class ELFRelaSection(TableUnderlay,
         self.clean()
         return True
 
-ELFRelaSection.static_init()
+ELFRelaSection.defer_static_init()
@@ -3,3 +3,48 @@
 # the  U.S. International Traffic in Arms Regulations or the U.S. Export Administration
 class ELFSection:
     types = frozenset()
+
+    # Lazy loads can leave this section as raw bytes until it's used.
+    lazy = True
+    # Needs decoding if the section it links to gets decoded,
+    # not just if that section's layout moves.
+    link_contents = False
+    # Holds raw section header indexes.
+    header_refs = False
+    # Shuffles the symbol table it links to when it's organized,
+    # so it has to go before anything else built from that table.
+    reorders_symbols = False
+    # Not every section keeps track of its header.
+    sheader = None
+    _dirty = False
+
+    @property
+    def dirty(self):
+        # Set when the contents change; cleared on load and save.
+        return self._dirty
+
+    @dirty.setter
+    def dirty(self, val):
+        self._dirty = val
+        if val and self.sheader is not None:
+            # We may have changed size; that moves the layout on.
+            self.sheader.parent.layout_changed()
+
+    def get_dependencies(self):
+        """
+        Get the headers of the sections this one is built from.
+
+        If any of them change, this section has to be
+        organized and verified again.  Usually that's
+        just whatever sh_link points at.
+        """
+        sheader = self.sheader
+        if sheader is None:
+            return list()
+        try:
+            link = sheader.get_referenced_object('sh_link')
+        except AttributeError:
+            return list()
+        if link is sheader:
+            return list()
+        return [ link ]
@@ -1,16 +1,24 @@
 # Copyright (c) 2020 Raytheon BBN Technologies, Inc.  All Rights Reserved.
 # This document does not contain technology or Technical Data controlled under either
 # the  U.S. International Traffic in Arms Regulations or the U.S. Export Administration
+import bisect
 from ...base import *
+from ...base.util import LookupIndex
 from .section import *
 from collections.abc import ByteString
 
 class ELFStrItem(ByteString,
                  ItemUnderlay):
+    # String tables hold tens of thousands of these.
+    __slots__ = ItemUnderlay.record_attrs + ('data',)
+
     def __init__(self, data, idx, offset, parent):
         super().__init__(idx=idx, offset=offset, parent=parent)
         self.data = data
 
+    def __reduce__(self):
+        return (ELFStrItem, (self.data, self._idx, self._offset, self.parent))
+
     def __getitem__(self, idx):
         return self.data[idx]
     
@@ -38,8 +46,10 @@ class ELFStrItem(ByteString,
             new_val += b'\x00'
         if not isinstance(new_val, bytes):
             raise TypeError('Cannot assign ELF string from {!s}'.format(type(new_val)))
+        old_val = self.data
         self.data = new_val
         self.clean()
+        self.parent.string_renamed(self, old_val)
 
     def to_bytes(self, write):
         write(self.data)
@@ -74,8 +84,23 @@ class ELFStrTab(TableUnderlay,
         bits = data[offset:end + 1]
         return ELFStrItem(bits, idx, offset, parent)
 
-    def __init__(self, **kwargs):
+    def __init__(self, sheader=None, **kwargs):
         super().__init__(**kwargs)
+        self.sheader = sheader
+        self.loaded_data = None
+        # Tables indexing names out of this one.
+        self.rename_watchers = list()
+        # Offsets of every string, in order; built on demand.
+        self.sorted_offsets = None
+        # String contents -> first string with them.
+        self.string_index = LookupIndex(self.string_entries)
+
+    def from_bytes(self, data):
+        # Every string gets copied out into its own item anyway,
+        # so copy the table once up front rather than parsing a view.
+        # Hang onto the copy; suffix references get split out of it.
+        self.loaded_data = bytes(data)
+        super().from_bytes(self.loaded_data)
 
     def get_item_by_offset(self, off):
         """
@@ -89,18 +114,109 @@ class ELFStrTab(TableUnderlay,
         If we run into this, deduplicate the string.
         """
         if off not in self.offset_to_item:
-            closest_off = -1
-            for k in self.offset_to_item:
-                if k < off and k > closest_off:
-                    closest_off = k
+            offsets = self.get_sorted_offsets()
+            i = bisect.bisect_left(offsets, off) - 1
+            closest_off = offsets[i] if i >= 0 else -1
             diff = off - closest_off
             new_str = self.offset_to_item[closest_off][diff:]
             item = ELFStrItem(new_str, 0, 0, self)
-            self.append(item)
+            self.append_string(item)
             off = item.offset
         return self.offset_to_item[off]
 
+    def get_loaded_item_by_offset(self, off):
+        """
+        Get a string by the offset it had when this table was loaded.
+
+        Suffix references get split out the same way as
+        get_item_by_offset() does, but from the bytes we loaded,
+        so it doesn't matter if the table changed since.
+        """
+        if self.loaded_offsets is None or off in self.loaded_offsets:
+            return super().get_loaded_item_by_offset(off)
+        end = self.loaded_data.index(0, off)
+        item = ELFStrItem(self.loaded_data[off:end + 1], 0, 0, self)
+        self.append_string(item)
+        return item
+
+    def get_sorted_offsets(self):
+        # Looking at the map lays out anything that's moved.
+        offset_to_item = self.offset_to_item
+        if self.sorted_offsets is None:
+            self.sorted_offsets = sorted(offset_to_item)
+        return self.sorted_offsets
+
+    def append_string(self, item):
+        # Nothing else moves, so just lay out the new string.
+        if self.offset_to_item is self.loaded_offsets:
+            # This is still the map from load time; leave it be.
+            self.offset_to_item = dict(self.offset_to_item)
+        if len(self.items) == 0:
+            end = 0
+        else:
+            end = self.items[-1].offset + self.items[-1].size
+        item._idx = len(self.items)
+        item._offset = end
+        self.items.append(item)
+        self.offset_to_item[end] = item
+        if self.sorted_offsets is not None:
+            self.sorted_offsets.append(end)
+        self.string_index.add(bytes(item.data), item)
+        self.dirty = True
+
+    def string_entries(self):
+        return ((bytes(item.data), item) for item in self.items)
+
+    def find_string(self, val):
+        if isinstance(val, str):
+            val = val.encode('ascii')
+            val += b'\x00'
+        return self.string_index.get(val)
+
+    def intern_string(self, val):
+        """
+        Get a string equal to <val>, adding one to the end if there isn't one.
+        """
+        item = self.find_string(val)
+        if item is None:
+            if isinstance(val, str):
+                val = val.encode('ascii')
+                val += b'\x00'
+            item = ELFStrItem(val, 0, 0, self)
+            self.append_string(item)
+        return item
+
+    def laid_out(self, start):
+        self.sorted_offsets = None
+
+    def get_loaded_string(self, off):
+        # Like get_loaded_item_by_offset(off).data,
+        # without splitting out suffix references.
+        if self.loaded_offsets is None or off in self.loaded_offsets:
+            return self.get_loaded_item_by_offset(off).data
+        end = self.loaded_data.index(0, off)
+        return self.loaded_data[off:end + 1]
+
+    def add_rename_watcher(self, table):
+        if table not in self.rename_watchers:
+            self.rename_watchers.append(table)
+
+    def string_renamed(self, item, old_val):
+        if self.string_index.built:
+            if self.string_index.get(bytes(old_val)) is item:
+                # Another string may have had the same contents; rebuild.
+                self.string_index.reset()
+            else:
+                self.string_index.add(bytes(item.data), item)
+        for table in self.rename_watchers:
+            table.string_renamed(item, old_val)
+
+    def clean(self, start=0):
+        super().clean(start)
+        # Strings got inserted, removed or replaced.
+        self.string_index.reset()
+
     def organize(self, *args):
         self.clean()
 
-ELFStrTab.static_init()
+ELFStrTab.defer_static_init()
@@ -1,7 +1,9 @@
 # Copyright (c) 2020 Raytheon BBN Technologies, Inc.  All Rights Reserved.
 # This document does not contain technology or Technical Data controlled under either
 # the  U.S. International Traffic in Arms Regulations or the U.S. Export Administration
+import bisect
 from ...base import *
+from ...base.util import LookupIndex
 from .section import *
 
 bindings = {
@@ -25,6 +27,8 @@ class ELFSymbol(ItemUnderlay,
                 PPrintUnderlay,
                 StructUnderlay,
                 BaseObject):
+    __slots__ = ()
+
     @classmethod
     def static_init(cls):
         super(ELFSymbol, cls).static_init(config_path='symbol.tsf')
@@ -39,7 +43,6 @@ class ELFSymbol(ItemUnderlay,
         byteorder = parent.byteorder
         wordsize = parent.wordsize
         super().__init__(idx=idx, offset=offset, parent=parent, byteorder=byteorder, wordsize=wordsize)
-        self.strtab=parent.strtab
 
     def print_info(self, *args):
         # Info defines two values in the upper and lower nibbles.
@@ -67,7 +70,8 @@ class ELFSymbol(ItemUnderlay,
         return elffile.sect_headers
 
     def get_strtab(self, elffile):
-        return elffile.sect_headers[self.strtab].section
+        # Go through our header's link; sections can move before we resolve.
+        return elffile.sect_headers[self.parent.sheader.sh_link].section
 
     def get_shndx_name(self, *args):
         # Special flag: absolute symbol
@@ -85,12 +89,14 @@ class ELFSymbol(ItemUnderlay,
     def __str__(self):
         return str(self.get_referenced_object('st_name'))
 
-ELFSymbol.static_init()
+ELFSymbol.defer_static_init()
 
 class ELFSymTab(ELFSection,
                 TableUnderlay,
                 BaseObject):
     types = frozenset([ 'SYMTAB', 'DYNSYM' ])
+    # st_shndx is a raw section header index.
+    header_refs = True
 
     @classmethod
     def static_init(cls):
@@ -98,12 +104,86 @@ class ELFSymTab(ELFSection,
         cls.parse_config()
 
     def __init__(self, sheader=None, byteorder='little', wordsize=4):
+        self.sheader = sheader
         self.strtab = sheader.sh_link
         self.byteorder = byteorder
         self.wordsize = wordsize
+        # Symbol name -> rows with that name, in order.
+        self.name_index = LookupIndex(self.name_entries, multi=True)
         super().__init__(byteorder=byteorder, wordsize=wordsize)
 
     def organize(self, *args):
         self.clean()
 
-ELFSymTab.static_init()
+    def clean(self, start=0):
+        super().clean(start)
+        if not self.frozen:
+            # Symbols may have been added, removed, or reordered.
+            self.name_index.reset()
+
+    def item_changed(self, item):
+        super().item_changed(item)
+        self.name_index.reset()
+
+    def get_strtab(self):
+        return self.sheader.parent[self.sheader.sh_link].section
+
+    def get_name_item(self, row, strtab):
+        # The string a row's name is, or will be once it's built.
+        if self.frozen and self.items.rows[row] is None:
+            off = self.items.loaded_values('st_name')[row]
+            return strtab.loaded_offsets.get(off)
+        return self.items[row].get_referenced_object('st_name')
+
+    def name_entries(self):
+        strtab = self.get_strtab()
+        # Renames don't touch this table; have the strings tell us.
+        strtab.add_rename_watcher(self)
+        if self.frozen:
+            # Untouched rows come straight from the loaded string table.
+            records = self.items
+            offsets = records.loaded_values('st_name')
+            for row in range(0, len(records)):
+                symbol = records.rows[row]
+                if symbol is None:
+                    name = strtab.get_loaded_string(offsets[row])
+                else:
+                    name = symbol.get_referenced_object('st_name').data
+                yield (bytes(name), row)
+        else:
+            for (row, symbol) in enumerate(self.items):
+                yield (bytes(symbol.get_referenced_object('st_name').data), row)
+
+    def get_symbol_by_name(self, name):
+        if isinstance(name, str):
+            name = name.encode('ascii')
+            name += b'\x00'
+        rows = self.name_index.get(name)
+        if rows is None:
+            return None
+        return self.items[rows[0]]
+
+    def string_renamed(self, item, old_val):
+        # Move symbols named by <item> to its new name.
+        index = self.name_index.index
+        if index is None:
+            return
+        rows = index.get(bytes(old_val))
+        if rows is None:
+            return
+        strtab = self.get_strtab()
+        moved = [ row for row in rows if self.get_name_item(row, strtab) is item ]
+        if len(moved) == 0:
+            return
+
+        moved_set = set(moved)
+        kept = [ row for row in rows if row not in moved_set ]
+        if len(kept) == 0:
+            del index[bytes(old_val)]
+        else:
+            index[bytes(old_val)] = kept
+        new_rows = index.setdefault(bytes(item.data), list())
+        for row in moved:
+            bisect.insort(new_rows, row)
+
+ELFSymTab.defer_static_init()
@@ -2,6 +2,7 @@
 # This document does not contain technology or Technical Data controlled under either
 # the  U.S. International Traffic in Arms Regulations or the U.S. Export Administration
 from ...base import *
+from ...base.util import LookupIndex
 from .section import *
 
 class ELFVerNeed(ReferenceUnderlay,
@@ -32,13 +33,15 @@ class ELFVerNeed(ReferenceUnderlay,
             self.pprint()
         return out
 
-ELFVerNeed.static_init()
+ELFVerNeed.defer_static_init()
 
 class ELFVerNeedAux(ItemUnderlay,
                 ReferenceUnderlay,
                 PPrintUnderlay,
                 StructUnderlay,
                 BaseObject):
+    __slots__ = ('sheader',)
+
     @classmethod
     def static_init(cls):
         super(ELFVerNeedAux, cls).static_init(config_path='verneedaux.tsf')
@@ -57,7 +60,7 @@ class ELFVerNeedAux(ItemUnderlay,
         # TODO: Think about what we need to verify here.
         return True
 
-ELFVerNeedAux.static_init()
+ELFVerNeedAux.defer_static_init()
 
 class ELFVerNeedAuxList(TableUnderlay, 
                     BaseObject):
@@ -72,7 +75,7 @@ class ELFVerNeedAuxList(TableUnderlay,
         self.byteorder = byteorder
         self.wordsize = wordsize
 
-ELFVerNeedAuxList.static_init()
+ELFVerNeedAuxList.defer_static_init()
 
 class ELFVerNeedEntry(ItemUnderlay,
                   BaseObject):
@@ -125,7 +128,7 @@ class ELFVerNeedEntry(ItemUnderlay,
         print("Aux:")
         self.aux.pprint()
 
-ELFVerNeedEntry.static_init()
+ELFVerNeedEntry.defer_static_init()
 
 class ELFVerNeedTable(TableUnderlay,
                       BaseObject,
@@ -148,5 +151,30 @@ class ELFVerNeedTable(TableUnderlay,
         self.sheader = sheader
         self.byteorder = byteorder
         self.wordsize = wordsize
+        # Version number (vna_other) -> aux entry.
+        # Aux lists don't know what table they're in;
+        # whatever changes them has to clean this table.
+        self.version_index = LookupIndex(self.version_entries)
+
+    def clean(self, start=0):
+        super().clean(start)
+        # Entries got inserted, removed or reordered.
+        self.version_index.reset()
+
+    def item_changed(self, item):
+        super().item_changed(item)
+        self.version_index.reset()
+
+    def version_entries(self):
+        for entry in self.items:
+            for aux in entry.aux:
+                yield (aux.vna_other, aux)
+
+    def find_version(self, version):
+        return self.version_index.get(version)
+
+    def has_version(self, version):
+        # 0 and 1 are local and global; they're always there.
+        return version == 0 or version == 1 or self.find_version(version) is not None
 
-ELFVerNeedTable.static_init()
+ELFVerNeedTable.defer_static_init()
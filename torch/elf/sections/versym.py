@@ -9,6 +9,8 @@ class ELFVerSym(ItemUnderlay,
                 PPrintUnderlay,
                 StructUnderlay,
                 BaseObject):
+    __slots__ = ('sheader',)
+
     @classmethod
     def static_init(cls):
         super(ELFVerSym, cls).static_init(config_path='versym.tsf')
@@ -23,6 +25,7 @@ class ELFVerSym(ItemUnderlay,
 
     def assign(self, val):
         self.versym = val
+        self.clean()
 
     def get_ver_string(self, *args):
         symtab = self.parent.get_symtab()
@@ -35,12 +38,10 @@ class ELFVerSym(ItemUnderlay,
         elif self.versym == 1:
             return "{!s}:\t1 (*global*)".format(symbol)
         else:
-            verneed = self.parent.get_verneed()
-            for entry in verneed:
-                for aux in entry.aux:
-                    # Looks GNU-specific; vna_other is used instead of vnd_idx
-                    if aux.vna_other == self.versym:
-                        return "{!s}:\t{:d} ({!s})".format(symbol, self.versym, aux.get_referenced_object('vna_name'))
+            # Looks GNU-specific; vna_other is used instead of vnd_idx
+            aux = self.parent.get_verneed().find_version(self.versym)
+            if aux is not None:
+                return "{!s}:\t{:d} ({!s})".format(symbol, self.versym, aux.get_referenced_object('vna_name'))
             return "{!s}:\t{:d} ( UNKNOWN!!! )".format(symbol, self.versym)
 
     def verify(self, root):
@@ -51,7 +52,7 @@ class ELFVerSym(ItemUnderlay,
         pass
 
 
-ELFVerSym.static_init()
+ELFVerSym.defer_static_init()
         
 
 class ELFVerSymTable(TableUnderlay,
@@ -78,14 +79,27 @@ class ELFVerSymTable(TableUnderlay,
         # The location off verneed only seems to be defined in the .dynamic section.
         # Problem is, it's defined by absolute address.
         # Not a terrible way to look it up, now that we're looking it up.
+        sheader = self.get_verneed_header()
+        if sheader is not None:
+            return sheader.section
+
+    def get_verneed_header(self):
         for sheader in self.sheader.parent:
             sh_type = sheader.sh_type
             if sheader.get_enum('sh_type', sh_type) == 'VERNEED':
-                return sheader.section
+                return sheader
+        return None
+
+    def get_dependencies(self):
+        # Versions come out of verneed, too.
+        out = super().get_dependencies()
+        verneed = self.get_verneed_header()
+        if verneed is not None:
+            out.append(verneed)
+        return out
 
     def verify(self, root):
         out = super().verify(root)
-        versions = set()
         symtab = self.get_symtab()
         # Check that our length matches the symtab length
         if len(self) != len(symtab):
@@ -93,23 +107,15 @@ class ELFVerSymTable(TableUnderlay,
             out = False
         # Check that every versym is a valid version reference.
         verneed = self.get_verneed()
-
-        # Add default versions
-        versions.add(0)
-        versions.add(1)
-
-        # Load versions from the VERNEED section.
-        for entry in verneed:
-            for aux in entry.aux:
-                versions.add(aux.vna_other)
-        for i in range(0, len(self.items)): 
+        for (i, versym) in enumerate(self.field_values('versym')):
+            if verneed.has_version(versym):
+                continue
             if i >= len(symtab):
                 symbol = "OUT OF BOUNDS"
             else:
                 symbol = str(symtab[i])
-            if self[i].versym not in versions:
-                self.l.error("Unknown version for symbol {:d} ({:s}): {:d}".format(i, symbol, self[i].versym))
-                out = False
+            self.l.error("Unknown version for symbol {:d} ({:s}): {:d}".format(i, symbol, versym))
+            out = False
         return out
 
     def organize(self, *args):
@@ -117,17 +123,11 @@ class ELFVerSymTable(TableUnderlay,
         # FIXME Hack to avoid using verdef sections.
         # We just set all unknown versions to global.
         # This is only in place to get results.
-        versions = set()
         verneed = self.get_verneed()
-
-        for entry in verneed:
-            for aux in entry.aux:
-                versions.add(aux.vna_other)
-
-        for i in range(0, len(self.items)):
-            if self[i].versym not in versions:
-                self[i].versym = 1 
+        for (i, versym) in enumerate(self.field_values('versym')):
+            if verneed.find_version(versym) is None:
+                self[i].versym = 1
             
 
 
-ELFVerSymTable.static_init()
+ELFVerSymTable.defer_static_init()
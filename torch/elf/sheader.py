@@ -2,12 +2,14 @@
 # This document does not contain technology or Technical Data controlled under either
 # the  U.S. International Traffic in Arms Regulations or the U.S. Export Administration
 from ..base import *
+from ..base.util import LookupIndex
 from .sections import types_to_sections, ELFProgBits
 
 SHT_PROGBITS = 1
 SHT_SYMTAB = 2
 SHT_STRTAB = 3
 SHT_NOBITS = 8
+SHT_GNU_HASH = 0x6ffffff6
 
 class ELFSectionTable(TableUnderlay,
                       BaseObject):
@@ -24,39 +26,106 @@ class ELFSectionTable(TableUnderlay,
         super().__init__()
         self.byteorder = byteorder
         self.wordsize = wordsize
+        # Section name -> header.
+        self.name_index = LookupIndex(self.name_entries)
+        # Bumped whenever sections move; see ELFFile.get_layout().
+        self.generation = 0
 
-    def load_sections(self, data):
+    def clean(self, start=0):
+        super().clean(start)
+        # Headers got inserted, removed or reordered.
+        self.name_index.reset()
+        self.layout_changed()
+
+    def item_changed(self, item):
+        super().item_changed(item)
+        self.name_index.reset()
+        self.layout_changed()
+
+    def string_renamed(self, item, old_val):
+        self.name_index.reset()
+
+    def layout_changed(self):
+        self.generation += 1
+
+    def load_sections(self, data, lazy=False):
         for sheader in self.items:
-            sheader.load_section(data)
+            sheader.load_section(data, lazy=lazy)
+
+    def load_dependents(self):
+        """
+        Decode any pending sections that can't be written back as-is.
+
+        A section left pending by a lazy load holds raw indexes
+        and offsets into the sections it links to.
+        Those are only good as long as nothing moved,
+        so anything that depends on a section that has
+        gets decoded, and written back out fresh.
+
+        Returns True if anything got decoded.
+        """
+        pending = [ sheader for sheader in self.items if sheader.pending is not None ]
+        if len(pending) == 0:
+            return False
+        headers_moved = self.moved_since_load()
+
+        out = False
+        changed = True
+        while changed:
+            changed = False
+            for sheader in pending:
+                if sheader.pending is not None and sheader.must_decode(headers_moved):
+                    sheader.decode_section()
+                    changed = True
+                    out = True
+        return out
     
+    def name_entries(self):
+        strtabs = list()
+        for item in self.items:
+            name = item.get_referenced_object('sh_name')
+            if name.parent not in strtabs:
+                # Renames don't touch this table; have the strings tell us.
+                name.parent.add_rename_watcher(self)
+                strtabs.append(name.parent)
+            yield (bytes(name.data), item)
+
+    def find_sect_header_by_name(self, name):
+        if isinstance(name, str):
+            name = name.encode('ascii')
+            name += b'\x00'
+        return self.name_index.get(name)
+
     def get_sect_header_by_name(self, name):
         if isinstance(name, str):
             name = name.encode('ascii')
             name += b'\x00'
-        for item in self.items:
-            if item.get_referenced_object('sh_name') == name:
-                return item
-        self.l.error("Could not find section {!s}".format(name))
-        raise Exception("Could not find section {!s}".format(name))
+        item = self.find_sect_header_by_name(name)
+        if item is None:
+            self.l.error("Could not find section {!s}".format(name))
+            raise Exception("Could not find section {!s}".format(name))
+        return item
 
     def verify(self, elffile):
         out = True
         # Verify the section-to-segment map.
         in_a_segment = set()
+        layout = elffile.get_layout()
         for segment in elffile.prog_headers:
             off_start = segment.p_offset
             off_end = off_start + segment.p_filesz
 
-            for section in self:
+            # Sections that start inside the segment, in table order.
+            starting = sorted(layout.sect_offsets.starting_in(off_start, off_end), key=lambda x: x.idx)
+            for section in starting:
                 sect_start = section.sh_offset
                 sect_end = sect_start + section.sh_size
 
-                if sect_start >= off_start and sect_start < off_end:
-                    in_a_segment.add(section)
-                    # Verify that the section is inside the segment.
-                    if sect_end > off_end:
-                        self.l.error("Section {!s} ends outside its segment!!! Segment [{:x}, {:x}] vs Section [{:x}, {:x}]".format(section, off_start, off_end, sect_start, sect_end))
-                        out = False
+                in_a_segment.add(section)
+                # Verify that the section is inside the segment.
+                if sect_end > off_end:
+                    self.l.error("Section {!s} ends outside its segment!!! Segment [{:x}, {:x}] vs Section [{:x}, {:x}]".format(section, off_start, off_end, sect_start, sect_end))
+                    out = False
 
         # Verify offset integrity, memory integrity, and size integrity.
         off_sorted_items = list(self.items)
@@ -155,6 +224,7 @@ class ELFSectionTable(TableUnderlay,
                 item_b.sh_offset += diff
                 item_b.sh_addr += diff
 
+        self.layout_changed()
 
 
 class ELFSectionHeader(ItemUnderlay,
@@ -168,6 +238,7 @@ class ELFSectionHeader(ItemUnderlay,
         cls.add_alt_handler('get_referenced_object', cls.get_referenced_object)
         cls.add_table_lookup('get_shstrtab', cls.get_shstrtab)
         cls.add_table_lookup('get_section', cls.get_section)
+        cls.add_table_lookup('get_self', cls.get_self)
         cls.add_table_lookup('get_sect_headers', cls.get_sect_headers)
         cls.parse_config()
 
@@ -175,7 +246,30 @@ class ELFSectionHeader(ItemUnderlay,
         byteorder = parent.byteorder
         wordsize = parent.wordsize
         super().__init__(idx=idx, offset=offset, parent=parent, config_path='sheader.tsf', byteorder=byteorder, wordsize=wordsize)
-        self.section = None
+        self._section = None
+        # Raw bits for a section we haven't decoded yet.
+        self.pending = None
+        self.root = None
+
+    @property
+    def section(self):
+        if self.pending is not None:
+            self.decode_section()
+        return self._section
+
+    @section.setter
+    def section(self, val):
+        # A new section has to be organized before it's written.
+        val.dirty = True
+        self._section = val
+        self.pending = None
+
+    @property
+    def section_size(self):
+        # Pending sections will be written back as-is.
+        if self.pending is not None:
+            return len(self.pending)
+        return self._section.size
 
     def get_shstrtab(self, elffile):
         return elffile.sect_headers[elffile.e_header.e_shstrndx].section
@@ -183,15 +277,22 @@ class ELFSectionHeader(ItemUnderlay,
     def get_section(self, *args):
         return self.section
 
+    def get_self(self, *args):
+        return self
+
     def get_sect_headers(self, elffile):
         return elffile.sect_headers
 
-    def load_section(self, data):
+    def load_section(self, data, lazy=False):
         start = self.sh_offset
         end = self.sh_offset + self.sh_size
         bits = data[ start : end ]
         section_type = self.get_enum("sh_type", self.sh_type)
         if section_type in types_to_sections:
+            if lazy and types_to_sections[section_type].lazy:
+                # Hang onto the bits; we'll decode them on first use.
+                self.pending = bits
+                return
             out = types_to_sections[section_type](sheader=self, byteorder=self.byteorder, wordsize=self.wordsize)
             out.from_bytes(bits)
             self.section = out
@@ -200,11 +301,61 @@ class ELFSectionHeader(ItemUnderlay,
             out.from_bytes(bits)
             self.section = out
 
+    def decode_section(self):
+        section_type = self.get_enum("sh_type", self.sh_type)
+        out = types_to_sections[section_type](sheader=self, byteorder=self.byteorder, wordsize=self.wordsize)
+        # Keep the bits pending until we're done; sh_size still needs them.
+        out.from_bytes(self.pending)
+        self.section = out
+
+        # If our own references are done, it's this section's turn.
+        # Otherwise, it'll happen when we get resolved.
+        if self.root is not None:
+            self.resolve_section_references(self.root)
+        # Decoding doesn't change anything.
+        out.dirty = False
+
+    def must_decode(self, headers_moved):
+        """
+        Check if this header's pending section has to be decoded.
+        """
+        section_class = types_to_sections[self.get_enum("sh_type", self.sh_type)]
+        if headers_moved and section_class.header_refs:
+            return True
+
+        try:
+            link = self.get_referenced_object('sh_link')
+        except AttributeError:
+            return False
+        if link is self or link.pending is not None:
+            return False
+        if section_class.link_contents:
+            return True
+        target = link.section
+        return isinstance(target, TableUnderlay) and target.moved_since_load()
+
+    def get_output_section(self):
+        """
+        Get the section to write out.
+
+        Pending sections get written back exactly as they were loaded.
+        """
+        if self.pending is not None:
+            out = ELFProgBits()
+            out.from_bytes(self.pending)
+            return out
+        return self.section
+
     def resolve_references(self, root):
         super().resolve_references(root)
-        if not isinstance(self.section, ELFProgBits):
+        self.root = root
+        if self.pending is None:
+            self.resolve_section_references(root)
+
+    def resolve_section_references(self, root):
+        if not isinstance(self._section, ELFProgBits):
             try:
-                self.section.resolve_references(root)
+                self._section.resolve_references(root)
             except AttributeError as e:
                 pass
 
@@ -2,24 +2,30 @@
 # This document does not contain technology or Technical Data controlled under either
 # the  U.S. International Traffic in Arms Regulations or the U.S. Export Administration
 import logging
+import mmap
 import pathlib
 from .loader import Loader
+from .snapshot import SnapshotCache
 
 class Executor:
-    def __init__(self):
+    def __init__(self, jobs=1, verify_level='FULL'):
         self.l = logging.getLogger('torch')
+        self.jobs = jobs
+        self.verify_level = verify_level
         self.cmd_table = {
             "LOAD": self.load
         }
 
         self.help_table = []
 
+        self.load_modes = { 'MMAP', 'CACHE' }
+
         self.loader_table = dict()
         for subclass in Loader.__subclasses__():
             self.loader_table[subclass.name] = subclass
         self.binary = None
 
-    def load(self, unused, loader, path):
+    def load(self, unused, loader, path, *modes):
         # DO NOT remove 'unused'.
         # Loader subclasses have a problem where
         # the entires in their command tables are functions,
@@ -37,16 +43,51 @@ class Executor:
         if not path.exists():
             return "Cannot find file {!s}".format(path)
 
+        # Trailing commas leave empty modes behind; ignore them.
+        modes = set(filter(lambda x: x != '', modes))
+        unknown_modes = modes - self.load_modes - loader.load_modes
+        if len(unknown_modes) != 0:
+            return "Unknown load modes: {!s}".format(unknown_modes)
+
+        if 'CACHE' in modes and not loader.snapshots:
+            return "Loader {:s} can't cache snapshots".format(loader.name)
+
         self.binary = loader()
+        self.binary.jobs = self.jobs
+        self.binary.verify_level = self.verify_level
         self.cmd_table.update(self.binary.cmd_table)
         self.help_table = self.binary.help_table
 
         with open(path, 'rb') as f:
-            data = f.read()
-            self.binary.load(data)
+            if 'MMAP' in modes:
+                # Map the file instead of reading it.
+                # Loaders slice views out of the mapping,
+                # so data nobody touches never gets copied.
+                # The mapping outlives the file handle.
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                data = f.read()
+            loader_modes = modes & loader.load_modes
+            if 'CACHE' in modes:
+                self.load_cached(loader, path, data, loader_modes)
+            else:
+                self.binary.load(data, *loader_modes)
 
         return None
 
+    def load_cached(self, loader, path, data, modes):
+        # Reuse the parsed binary from an earlier run if we have one.
+        cache = SnapshotCache()
+        key = cache.key(loader, data, modes)
+        snapshot = cache.get(key)
+        if snapshot is not None:
+            self.l.info("Loaded {!s} from the snapshot cache".format(path))
+            self.binary.load_snapshot(snapshot)
+            return
+
+        self.binary.load(data, *modes)
+        cache.put(key, self.binary.get_snapshot())
+
     def execute(self, path):
         with open(path, 'r') as f:
             line = f.readline().strip()
@@ -1,8 +1,8 @@
 # Copyright (c) 2020 Raytheon BBN Technologies, Inc.  All Rights Reserved.
 # This document does not contain technology or Technical Data controlled under either
 # the  U.S. International Traffic in Arms Regulations or the U.S. Export Administration
-import inspect
 import logging
+from types import FunctionType
 from .help import HelpObj
 
 def command(f):
@@ -16,17 +16,36 @@ def help(*helps, args=[], errors=[]):
     return make_type
 
 class Loader:
+    # Extra LOAD modes this loader understands.
+    load_modes = frozenset()
+    # Whether loaded binaries can be cached with the CACHE load mode.
+    snapshots = False
+    # Worker processes to spread verification across.
+    jobs = 1
+    # How thoroughly to check binaries before saving them.
+    verify_level = 'FULL'
+
     @classmethod
     def static_init(cls, name):
         cls.name = name
         cls.cmd_table = dict()
         cls.help_table = list()
         cls.l = logging.getLogger('torch.{:s}'.format(name))
-        for (name, f) in inspect.getmembers(cls, predicate=inspect.isfunction):
+        # Plain dir() instead of inspect.getmembers; inspect costs a lot to import.
+        for name in dir(cls):
+            f = getattr(cls, name)
+            if not isinstance(f, FunctionType):
+                continue
             if hasattr(f, 'torch_cmd'):
                 cls.cmd_table[name.upper()] = f 
             if hasattr(f, 'torch_help'):
                 cls.help_table.append(f.torch_help)
 
-    def load(self, data):
+    def load(self, data, *modes):
         raise AttributeError("load is not defined for {!s}".format(type(self)))
+
+    def get_snapshot(self):
+        raise AttributeError("get_snapshot is not defined for {!s}".format(type(self)))
+
+    def load_snapshot(self, snapshot):
+        raise AttributeError("load_snapshot is not defined for {!s}".format(type(self)))
@@ -0,0 +1,189 @@
+# Copyright (c) 2020 Raytheon BBN Technologies, Inc.  All Rights Reserved.
+# This document does not contain technology or Technical Data controlled under either
+# the  U.S. International Traffic in Arms Regulations or the U.S. Export Administration
+import copyreg
+import io
+import logging
+import os
+import pathlib
+import pickle
+from ..base.underlays.reference import no_references
+
+# Bump this if the layout of cache entries changes.
+SNAPSHOT_VERSION = 1
+
+# Default cap on the cache directory's total size.
+DEFAULT_MAX_SIZE = 1 << 30
+
+class SnapshotPickler(pickle.Pickler):
+    # Sections loaded from a mapping hold views into it;
+    # snapshots hold copies.
+    dispatch_table = copyreg.dispatch_table.copy()
+    dispatch_table[memoryview] = lambda view: (bytes, (view.tobytes(),))
+
+    def persistent_id(self, obj):
+        # Records share a single empty reference map; keep it that way.
+        if obj is no_references:
+            return 'no_references'
+        return None
+
+class SnapshotUnpickler(pickle.Unpickler):
+    def persistent_load(self, pid):
+        if pid == 'no_references':
+            return no_references
+        raise pickle.UnpicklingError("Unknown persistent id {!s}".format(pid))
+
+    def find_class(self, module, name):
+        # Record classes only exist once their owner's static_init has run,
+        # and some classes put that off until they're first used.
+        owner = super().find_class(module, name.split('.', 1)[0])
+        if hasattr(owner, 'ensure_static_init'):
+            owner.ensure_static_init()
+        return super().find_class(module, name)
+
+class SnapshotCache:
+    """
+    On-disk cache of freshly loaded binaries.
+
+    Entries are pickled copies of a loader's binary,
+    taken right after it's parsed and before any commands run.
+    They're keyed on a hash of the input file,
+    the loader and load modes used,
+    and the version and sources of torch itself,
+    so editing torch (or its .tsf configs) invalidates everything.
+
+    The cache lives in TORCH_SNAPSHOT_DIR if that's set,
+    or under the user's cache directory otherwise.
+    TORCH_SNAPSHOT_CACHE_SIZE caps its total size, in bytes;
+    the least recently used entries get evicted first.
+    """
+    def __init__(self, path=None, max_size=None):
+        self.l = logging.getLogger('torch.snapshot')
+        if path is None:
+            path = default_cache_dir()
+        if max_size is None:
+            max_size = int(os.environ.get('TORCH_SNAPSHOT_CACHE_SIZE', DEFAULT_MAX_SIZE))
+        self.path = pathlib.Path(path)
+        self.max_size = max_size
+
+    def key(self, loader, data, modes):
+        # Imported here; OpenSSL is slow to load, and most runs don't cache.
+        import hashlib
+        h = hashlib.sha256()
+        h.update('{:d}:{:s}:{:s}:{:s}:'.format(SNAPSHOT_VERSION, torch_version(), loader.name, ','.join(sorted(modes))).encode('utf-8'))
+        h.update(source_stamp())
+        h.update(data)
+        return h.hexdigest()
+
+    def entry_path(self, key):
+        return self.path / '{:s}.pickle'.format(key)
+
+    def get(self, key):
+        path = self.entry_path(key)
+        try:
+            with open(path, 'rb') as f:
+                if not self.trusted(self.path.stat()) or not self.trusted(os.fstat(f.fileno())):
+                    self.l.warning("Ignoring snapshot {!s}; someone else could have written it".format(path))
+                    return None
+                obj = SnapshotUnpickler(f).load()
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            self.l.warning("Dropping unreadable snapshot {!s}: {!s}".format(path, e))
+            self.remove(path)
+            return None
+
+        # Mark it as recently used.
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.l.debug("Loaded snapshot {!s}".format(path))
+        return obj
+
+    def trusted(self, st):
+        # Unpickling runs code; only trust what nobody else can write.
+        return st.st_uid == os.getuid() and st.st_mode & 0o022 == 0
+
+    def put(self, key, obj):
+        buf = io.BytesIO()
+        try:
+            SnapshotPickler(buf, protocol=pickle.HIGHEST_PROTOCOL).dump(obj)
+        except (pickle.PicklingError, TypeError, AttributeError, RecursionError) as e:
+            self.l.warning("Couldn't snapshot the loaded binary: {!s}".format(e))
+            return False
+
+        data = buf.getbuffer()
+        if len(data) > self.max_size:
+            self.l.debug("Snapshot is bigger than the whole cache; not keeping it.")
+            return False
+
+        path = self.entry_path(key)
+        tmp_path = path.with_name('{:s}.{:d}.tmp'.format(path.name, os.getpid()))
+        try:
+            self.path.mkdir(mode=0o700, parents=True, exist_ok=True)
+            with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            self.l.warning("Couldn't write snapshot {!s}: {!s}".format(path, e))
+            self.remove(tmp_path)
+            return False
+        self.l.debug("Saved snapshot {!s}".format(path))
+        self.evict()
+        return True
+
+    def evict(self):
+        entries = list()
+        total = 0
+        for path in self.path.glob('*.pickle'):
+            try:
+                st = path.stat()
+            except OSError:
+                # Someone else evicted it first.
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+        entries.sort()
+        for (mtime, size, path) in entries:
+            if total <= self.max_size:
+                break
+            self.l.debug("Evicting snapshot {!s}".format(path))
+            self.remove(path)
+            total -= size
+
+    def remove(self, path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+def default_cache_dir():
+    if 'TORCH_SNAPSHOT_DIR' in os.environ:
+        return os.environ['TORCH_SNAPSHOT_DIR']
+    base = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(base, 'torch', 'snapshots')
+
+def torch_version():
+    from .. import __version__
+    return __version__
+
+stamp = None
+def source_stamp():
+    """
+    Summarize the state of torch's own sources.
+
+    Snapshots are pickled record objects, so they're only good
+    for the exact code (and .tsf configs) that made them.
+    """
+    global stamp
+    if stamp is None:
+        root = pathlib.Path(__file__).parent.parent
+        parts = list()
+        for path in sorted(root.rglob('*')):
+            if path.suffix in ('.py', '.tsf'):
+                st = path.stat()
+                parts.append('{!s}:{:d}:{:d}'.format(path.relative_to(root), st.st_size, st.st_mtime_ns))
+        stamp = '\n'.join(parts).encode('utf-8')
+    return stamp